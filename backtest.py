@@ -1,12 +1,19 @@
+import numpy
 import pandas
 import json
 import math
+import dis
 from datetime import date, datetime
 from enum import Enum
 from prettytable import PrettyTable
 from indicators import StDev, MondayAnchor, HighestValue, LowestValue
 import calendar_calcs
-from security import SecType
+from security import SecType, format_dates, to_ordinal
+from pricing import bs_price, implied_vol, DAYS_PER_YEAR
+from panel import SecurityPanel, MissingPolicy
+from resample import HigherTimeframe
+from signals import rolling_stdev, first_passage, trailing_stops, EXIT_LABELS
+from recorder import SeriesRecorder, SeriesMode, Trade, TradeLedger
 from df_html_fancy import basic_table_to_html 
 
 class DumpFormat(str, Enum):
@@ -19,6 +26,33 @@ class TradeType(str, Enum):
     SELL = 'SELL'
     BUY = 'BUY'
 
+## fields carried as int day ordinals, rendered as strings on export
+DATE_FIELDS = ['Date', 'InDate', 'ExDate', 'Expiry']
+
+## strategy hooks run() calls on every bar, in call order
+BAR_HOOKS = ['exit_OPEN', 'entry_OPEN', 'calc_strategy_analytics', 'exit_CLOSE', 'trade_update', 'entry_CLOSE']
+## called on every bar the strategy is flat
+LIMIT_HOOKS = ['update_position_limit', 'update_wallet_alloc', 'update_dollar_limit']
+
+## bytecode a hook with no side effects is made of: attribute loads,
+## compares, branches and returns - no calls, no stores
+_NOOP_OPS = {'RESUME', 'NOP', 'CACHE', 'LOAD_FAST', 'LOAD_FAST_LOAD_FAST', 'LOAD_CONST', 'LOAD_ATTR',
+             'COMPARE_OP', 'IS_OP', 'UNARY_NOT', 'TO_BOOL', 'POP_TOP', 'RETURN_VALUE', 'RETURN_CONST',
+             'JUMP_FORWARD'}
+
+
+def is_noop(func):
+    ## True when func can't do anything: a pass body, or the guard
+    ## only bodies of the hook templates (if self.FLAT: return ...).
+    ## properties read on the way are assumed side effect free
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return False
+    for ins in dis.get_instructions(code):
+        if ins.opname not in _NOOP_OPS and not ins.opname.startswith('POP_JUMP_'):
+            return False
+    return True
+
 
 class BackTest():
     def __init__(self, security, json_config, ref_index=None):
@@ -32,7 +66,11 @@ class BackTest():
                                 "StDev": 50,
                                 "ma200": 200,
                                 "duration": 10,
-                                "start_dete": "2014-01-01"
+                                "start_dete": "2014-01-01",
+                                "ref_missing": "FFILL",
+                                "timeframes": ["W", "M"],
+                                "warmup_bars": 200,
+                                "series": "FULL"
                             },
                         "wallet":
                             {
@@ -48,6 +86,20 @@ class BackTest():
                             }
         }
 
+        ref_index = reference Security (or list of them) aligned onto
+                    the security's trading calendar. missing reference dates
+                    are handled per settings 'ref_missing': SKIP, FFILL or NAN
+
+        settings 'timeframes' = higher timeframes resampled from the security
+                    (resample.Period values or '30min' style intervals).
+                    self.htf[timeframe] holds the latest bar of each that
+                    closed before the current bar opened, None until the
+                    first one closes - the current period is never visible
+
+        settings 'series' = what trade_series records per bar (recorder.SeriesMode):
+                    FULL (default) or EQUITY - Date and Equity only, for
+                    sweeps that just need the metrics
+
         Security Class - member variables:
             self.symbol = symbol string 9
             self.sec_type = SecType enum
@@ -55,8 +107,8 @@ class BackTest():
             self.leverage_target = leverage target for futures 
             self.tick_size = tick size 
             self.tick_value = tick value 
-            self._df = datafram of securirty time series 
-            self._use_raw = use non adjusted prices
+            self._data = shared columnar bar store of the security time series 
+            self._adjust = price adjustment mode (RAW, SPLIT, TOTAL_RETURN)
         """
 
         ## strategy settings 
@@ -64,13 +116,37 @@ class BackTest():
 
         ## turn on backtest
         self.backtest_enabled = True 
+        ## InSignal label of trades entered by run_vectorized()
+        self.entry_label = ''
         settings = self.config.get('settings')
+        ## bars of indicator warm-up replayed ahead of start_date.
+        ## None replays the full history
+        self.warmup_bars = None
+        self.start_dt = None
+        ## OPTION positions: rate used for theoretical marks
+        self.risk_free = 0.0
+        self.series_mode = SeriesMode.FULL
         if settings:
             self.start_dt = self.start_from( settings.get("start_date") )
+            self.warmup_bars = settings.get("warmup_bars")
+            self.risk_free = float( settings.get("risk_free", 0.0) )
+            self.series_mode = SeriesMode( settings.get("series", SeriesMode.FULL) )
 
         ## Security objects
         self.security = security  
         self.ref_index = ref_index 
+        self.panel = None
+        if ref_index is not None:
+            ref_missing = MissingPolicy.FFILL
+            if settings:
+                ref_missing = settings.get('ref_missing', MissingPolicy.FFILL)
+            self.panel = SecurityPanel(security, ref_index, policy=ref_missing)
+
+        ## higher timeframe bars - resampled once, looked up on every step
+        self.timeframes = []
+        self.htf = dict()
+        if settings:
+            self.timeframes = [ HigherTimeframe(security, tf) for tf in settings.get('timeframes', []) ]
 
         self.wallet = 0 
         self.wallet_alloc_pct = 1
@@ -84,12 +160,14 @@ class BackTest():
         self.leverage_target = None
         self._initialize_limits()
 
-        ## dict of { date, price, position, ex_date, ex_price, entry_label, exit_label, ... }
+        ## recorder.Trade of the open position - InDate, Entry, Position, StopLevel, ...
         self.current_trade = None  
 
         self.pnl = 0
-        self.trades = list()
-        self.trade_series = list()
+        ## closed trades, one ledger row each
+        self.trades = TradeLedger(timed=security.intraday, contracts=security.sec_type == SecType.OPTION)
+        ## per bar series - a SeriesRecorder sized by run()
+        self.trade_series = SeriesRecorder(0, self.series_mode)
 
         ## backtest metrics dict
         self.metrics = None
@@ -101,6 +179,8 @@ class BackTest():
         self.anchor = MondayAnchor(derived_len=20)
         self.holidays = calendar_calcs.load_holidays()
 
+        ## the strategy hooks that do something - run() only calls these
+        self.hooks = self.active_hooks()
 
     def _initialize_wallet(self):
         wallet_dict = self.config.get('wallet')
@@ -119,21 +199,21 @@ class BackTest():
     @property
     def LONG(self):
         if self.current_trade is not None:
-            if self.current_trade['Position'] > 0:
+            if self.current_trade.Position > 0:
                 return True
         return False
 
     @property
     def SHORT(self):
         if self.current_trade is not None:
-            if self.current_trade['Position'] < 0:
+            if self.current_trade.Position < 0:
                 return True
         return False
 
     @property
     def CLOSED(self):
         ## trade state BEFORE self.current_trade is reset to None
-        if self.current_trade and self.current_trade.get('Exit'):
+        if self.current_trade and self.current_trade.Exit:
             return True
         return False
 
@@ -142,10 +222,19 @@ class BackTest():
         if self.current_trade is None:
             return True
         return False
+
+    @property
+    def backtest_disabled(self):
+        ## the strategies test this before trading
+        return not self.backtest_enabled
             
     ## trade execution functions
 
-    def enter_trade(self, trade_type, str_dt, security, price, label=''):
+    def enter_trade(self, trade_type, str_dt, security, price, label='', contract=None, index=None):
+
+        ## contract = (expiry, strike, right) of the option traded
+        ## when security is a SecType.OPTION
+        ## index = security row of the bar traded, the cursor's current bar by default
 
         if not self.wallet:
             return None 
@@ -155,6 +244,10 @@ class BackTest():
             ## allocate based on margin requirment per contact.
             ## otherwise it would be share price
             basis = security.margin_req
+
+        if security.sec_type == SecType.OPTION:
+            ## premium per contract
+            basis = price * security.tick_value / security.tick_size
             
 
         if self.wallet > 0:
@@ -186,32 +279,38 @@ class BackTest():
             if trade_type == TradeType.SELL:
                 shares = -shares
 
-            return dict(InDate=str_dt, Entry=price, Position=shares, DollarBase=dollar_base, Duration=0, InSignal=label)
-
+            trade = Trade(InDate=str_dt, Entry=price, Position=shares, DollarBase=dollar_base, Duration=0, InSignal=label)
+            trade.InBar = security.current_index() if index is None else index
+            trade.InTime = security.bar_time(trade.InBar)
+            if contract is not None:
+                expiry, strike, right = contract
+                trade.Contract = (to_ordinal(expiry), float(strike), right)
+            return trade
 
-    def exit_trade(self, str_dt, security, price, label=""):
 
-        def _reorder_keys(dikt, keys_order):
-            return {key: dikt[key] for key in keys_order if key in dikt}
+    def exit_trade(self, str_dt, security, price, label="", index=None):
 
-        exit_dt = str_dt
         tick_size = security.tick_size
         tick_value = security.tick_value
 
         assert(tick_size > 0)
         assert(tick_value > 0)
 
-        delta = price - self.current_trade['Entry']
-        trade_value = (delta/tick_size) * tick_value * self.current_trade['Position']
+        trade = self.current_trade
+        delta = price - trade.Entry
+        trade_value = (delta/tick_size) * tick_value * trade.Position
 
         self.pnl += trade_value
-        rtn = trade_value/self.current_trade['DollarBase']
-        exit_dict = dict(ExDate=str_dt, Exit=price, Value=trade_value, TradeRtn=rtn, PNL=self.pnl, ExSignal=label)
+        trade.ExDate = str_dt
+        trade.Exit = price
+        trade.Value = trade_value
+        trade.TradeRtn = trade_value/trade.DollarBase
+        trade.PNL = self.pnl
+        trade.ExSignal = label
+        trade.ExBar = security.current_index() if index is None else index
+        trade.ExTime = security.bar_time(trade.ExBar)
 
-        self.current_trade.update(exit_dict)
-
-        dict_order = 'InDate ExDate Position Duration InSignal Entry ExSignal Exit DollarBase Value TradeRtn PNL'
-        self.trades.append( _reorder_keys(self.current_trade, dict_order.split()) )
+        self.trades.append(trade)
 
 
     def initialize_stop(self, anchor):
@@ -256,13 +355,13 @@ class BackTest():
 
         if self.LONG:
             self.high_marker.push(bar['High'])
-            stop_level = self.current_trade['StopLevel']
-            self.current_trade['StopLevel'] = max(stop_level, self.calc_price_stop( self.high_marker.highest))
+            stop_level = self.current_trade.StopLevel
+            self.current_trade.StopLevel = max(stop_level, self.calc_price_stop( self.high_marker.highest))
 
         if self.SHORT:
             self.low_marker.push(bar['Low'])
-            stop_level = self.current_trade['StopLevel']
-            self.current_trade['StopLevel'] = min(stop_level, self.calc_price_stop( self.low_marker.lowest))
+            stop_level = self.current_trade.StopLevel
+            self.current_trade.StopLevel = min(stop_level, self.calc_price_stop( self.low_marker.lowest))
 
 
 
@@ -331,18 +430,15 @@ class BackTest():
 
     def generate_metrics(self):
 
-        trades_df = pandas.DataFrame(self.trades)
-        pnl_series = pandas.DataFrame(self.trade_series)
-
-        wins = trades_df[ trades_df['Value'] > 0]
+        equity = pandas.Series(self.trade_series.column('Equity'))
 
-        trade_count = len(trades_df)
-        win_pct = len(wins)/trade_count
+        trade_count = len(self.trades)
+        win_pct = int((self.trades.column('Value') > 0).sum())/trade_count
 
-        returns = (pnl_series['Equity'] / pnl_series['Equity'].shift(1)) - 1
+        returns = (equity / equity.shift(1)) - 1
         returns.dropna(inplace=True)
 
-        trade_returns = trades_df['TradeRtn'] 
+        trade_returns = pandas.Series(self.trades.column('TradeRtn'))
 
         trade_wins = trade_returns[trade_returns >= 0]
         trade_losses = trade_returns[trade_returns < 0]
@@ -352,18 +448,20 @@ class BackTest():
         avg_loss = trade_losses.mean()
 
         ## vectorized calc of drawdown
-        rolling_max = pnl_series['Equity'].cummax()
-        jj = (pnl_series['Equity']/rolling_max) - 1
+        rolling_max = equity.cummax()
+        jj = (equity/rolling_max) - 1
         dd = jj.min()
 
-        years = float(pnl_series.shape[0]/252.0)
+        ## bars per year: 252 on daily data, scaled by bars per day intraday
+        periods = self.security.periods_per_year()
+        years = float(len(equity)/periods)
 
         #total return
-        totalRtn = (pnl_series.iloc[-1]['Equity']/pnl_series.iloc[0]['Equity']) - 1
+        totalRtn = (equity.iloc[-1]/equity.iloc[0]) - 1
 
         #compounded annualize growth rate
-        cagr = ((pnl_series.iloc[-1]['Equity']/pnl_series.iloc[0]['Equity']) ** (1.0/years)) - 1
-        sharpe = cagr/(returns.std() * math.sqrt(252))
+        cagr = ((equity.iloc[-1]/equity.iloc[0]) ** (1.0/years)) - 1
+        sharpe = cagr/(returns.std() * math.sqrt(periods))
 
         self.metrics = dict(Sharpe=sharpe,
                         CAGR=cagr,
@@ -379,7 +477,7 @@ class BackTest():
 
     def format_df(self, lst_dicts):
         def _fstr(value):
-            if value is None:
+            if value is None or pandas.isna(value):
                 return ""
 
             v = round(value, 3)
@@ -389,10 +487,10 @@ class BackTest():
             return str(v)
 
         def _istr(value):
-            if value is None:
+            if value is None or pandas.isna(value):
                 return ""
 
-            return str(value)
+            return str(int(value))
 
         def _format(dikt):
             float_fields = 'Entry Exit StopLevel MTM Equity DollarBase Value TradeRtn PNL'.split()
@@ -406,10 +504,19 @@ class BackTest():
         for dikt in lst_dicts:
             formatted_list.append(_format(dikt))
 
-        df = pandas.DataFrame(formatted_list)
+        df = self.export_df(formatted_list)
         df = df.fillna("")
         return df
 
+    def export_df(self, lst_dicts):
+        ## dates are int day ordinals inside the engine -
+        ## only render them as 'YYYY-MM-DD' strings here
+        df = pandas.DataFrame(lst_dicts)
+        for col in DATE_FIELDS:
+            if col in df.columns:
+                df[col] = format_dates(df[col])
+        return df
+
     def format_table(self, pretty_table):
         COLUMNS_TO_CENTER = 'Date InDate ExDate InSignal ExSignal'.split()
         #float_fields = 'Close Entry Exit StopLevel MTM Equity'.split()
@@ -429,7 +536,7 @@ class BackTest():
 
     def dump_trades(self, formats=[DumpFormat.CSV]):
         ## stdout, csv, html
-        trades_df = pandas.DataFrame(self.trades)
+        trades_df = self.export_df(self.trades.frame())
         if DumpFormat.CSV in formats:
             trades_df = trades_df.round(4)
             trades_df.to_csv('trades.csv', index=False)
@@ -444,7 +551,7 @@ class BackTest():
             print(daily_table)
 
         if DumpFormat.HTML in formats:
-            trades_df = self.format_df(self.trades)
+            trades_df = self.format_df(self.trades.frame().to_dict(orient='records'))
             html = basic_table_to_html(trades_df, 'BackTest Trades')
             with open('trades.html', 'w') as f:
                 f.write(html + '\n')
@@ -452,7 +559,7 @@ class BackTest():
 
     def dump_trade_series(self, formats=[DumpFormat.STDOUT]):
         ## stdout, csv, html
-        trade_series_df = pandas.DataFrame(self.trade_series)
+        trade_series_df = self.export_df(self.trade_series.frame())
         trade_series_df = trade_series_df.round(4)
         pnl_series_df = trade_series_df[['Date','Equity']]
         if DumpFormat.CSV in formats:
@@ -461,7 +568,8 @@ class BackTest():
 
         if DumpFormat.STDOUT in formats:
             trade_series_df = trade_series_df.fillna("")
-            trade_series_df['MTM'] = trade_series_df['MTM'].replace(0,"")
+            if 'MTM' in trade_series_df.columns:
+                trade_series_df['MTM'] = trade_series_df['MTM'].replace(0,"")
             #trade_series_df['MTM'] = trade_series_df['MTM'].map(lambda x:f'{x:,.2f}')
             #trade_series_df['Equity'] = trade_series_df['Equity'].map(lambda x:f'{x:,.2f}')
             col_list = trade_series_df.columns.tolist()
@@ -472,7 +580,7 @@ class BackTest():
             print(daily_table)
 
         if DumpFormat.HTML in formats:
-            trades_series_df = self.format_df(self.trade_series)
+            trades_series_df = self.format_df(self.trade_series.frame().to_dict(orient='records'))
             html = basic_table_to_html(trades_series_df, 'Backtest Series')
             with open('trades_series.html', 'w') as f:
                 f.write(html + '\n')
@@ -517,8 +625,8 @@ class BackTest():
 
 
     def results(self):
-        trades_df = pandas.DataFrame(self.trades)
-        trade_series_df = pandas.DataFrame(self.trade_series)
+        trades_df = self.export_df(self.trades.frame())
+        trade_series_df = self.export_df(self.trade_series.frame())
         metrics_df = pandas.DataFrame([self.metrics])
         metrics_df = metrics_df.T
         metrics_df.reset_index(inplace = True)
@@ -543,110 +651,350 @@ class BackTest():
         tick_value = self.security.tick_value
         m = tick_value/tick_size
     
-        return m * (mark_price - self.current_trade['Entry']) * self.current_trade['Position']
+        return m * (mark_price - self.current_trade.Entry) * self.current_trade.Position
+
+    def option_mark(self, bar):
+        ## mark an OPTION position at today's chain mid. when the contract
+        ## isn't quoted, fall back to its black-scholes value at the last
+        ## implied vol seen - bar is the underlying's bar
+        trade = self.current_trade
+        expiry, strike, right = trade.Contract
+        chain = self.security.option_chain()
+        dt = bar['Date']
+        spot = bar['Close']
+        T = max(expiry - dt, 0) / DAYS_PER_YEAR
+
+        index = chain.lookup(dt, expiry, strike, right)
+        if index is not None:
+            quote = chain.quote(index)
+            mid = quote.get('Last')
+            if quote.get('Bid', 0) > 0 and quote.get('Ask', 0) > 0:
+                mid = 0.5 * (quote['Bid'] + quote['Ask'])
+            if mid is not None and math.isfinite(mid):
+                iv = implied_vol(mid, spot, strike, T, self.risk_free, right)
+                if math.isfinite(iv):
+                    trade.IV = float(iv)
+                return mid
+
+        iv = trade.IV
+        if iv is None:
+            return trade.Entry
+        return float( bs_price(spot, strike, T, self.risk_free, iv, right) )
        
-    def record_backtest_data(self, bar):
+    def new_series(self):
+        ## recorder for the bars left from the cursor position
+        lo, hi = self.security.remaining_range()
+        columns = self.security.remaining_columns()
+        return SeriesRecorder(hi - lo, self.series_mode,
+                              timed='Timestamp' in columns, contracts='Contract' in columns)
 
-        row = dict( 
-                Date=bar['Date'],
-                Close=bar['Close'],
-                InSignal="",
-                Entry=None,
-                ExSignal="",
-                Exit=None,
-                Position=None,
-                StopLevel=None,
-                MTM= None,
-                Equity=None
-            ) 
+    def record_backtest_data(self, bar):
 
+        ## write the bar's row into trade_series once the backtest is
+        ## enabled - returns the bar's MTM
         mtm = 0 
-        if not self.FLAT:
-            if bar['Date'] == self.current_trade['InDate']:
-                row['InSignal'] = self.current_trade['InSignal']
-                row['Entry'] = self.current_trade['Entry']
+        trade = self.current_trade
+        if trade is not None:
+            mark_price = bar['Close']
+            if trade.Contract is not None:
+                mark_price = self.option_mark(bar)
+            mtm = self.mark_to_market( mark_price ) 
+
+        if not self.backtest_enabled:
+            return mtm
+
+        series = self.trade_series
+        if not series.full:
+            series.record(bar['Date'], None, mtm, self.wallet + mtm,
+                          time=bar.get('Timestamp'), contract=bar.get('Contract'))
+            return mtm
+
+        in_signal, entry, ex_signal, exit, position, stop = '', numpy.nan, '', numpy.nan, numpy.nan, numpy.nan
+        if trade is not None:
+            ## matched on the bar row - intraday a day has many bars
+            if bar.index == trade.InBar:
+                in_signal = trade.InSignal
+                entry = trade.Entry
+
+            position = trade.Position
+            if trade.StopLevel is not None:
+                stop = trade.StopLevel
+
+            if bar.index == trade.ExBar:
+                ex_signal = trade.ExSignal
+                exit = trade.Exit
+
+        ## Time intraday, Contract held on continuous futures
+        series.record(bar['Date'], bar['Close'], mtm, self.wallet + mtm, in_signal, entry, ex_signal,
+                      exit, position, stop, time=bar.get('Timestamp'), contract=bar.get('Contract'))
+        return mtm
+
+
+    def calc_strategy_analytics(self, cur_dt, bar, ref_bar):
+        pass
 
-            row['Position'] = self.current_trade['Position']
-            row['StopLevel'] = self.current_trade['StopLevel']
+        ## create all derived data and indicatirs here 
 
-            if bar['Date'] == self.current_trade.get('ExDate'):
-                row['ExSignal'] = self.current_trade['ExSignal']
-                row['Exit'] = self.current_trade['Exit']
 
-            mtm = self.mark_to_market( bar['Close']) 
+    def entry_signal(self, columns):
+        ## vectorized entry_OPEN for run_vectorized(): bool array over the
+        ## bar columns, True where a trade is entered at the Open.
+        ## InSignal of those trades is self.entry_label
+        pass
 
-        row['MTM'] =  mtm
-        row['Equity'] = self.wallet + mtm 
 
-        return row
+    def active_hooks(self):
+        ## { name: bound method } of the BAR_HOOKS / LIMIT_HOOKS the strategy
+        ## overrides with a body that does something. trade_update is the
+        ## only one BackTest implements itself
+        hooks = dict()
+        for name in BAR_HOOKS + LIMIT_HOOKS:
+            method = getattr(self, name)
+            func = getattr(method, '__func__', method)
+            if is_noop(func):
+                continue
+            if func is getattr(BackTest, name) and name != 'trade_update':
+                continue
+            hooks[name] = method
+        return hooks
 
+    def bar_step(self, start_index):
 
-    def calc_strategy_analytics(self, cur_dt, bar, ref_bar):
-        pass
+        """
+        the per bar body of run(), specialized to the strategy: no-op
+        hooks are left out and the FLAT / CLOSED checks read current_trade
+        directly. BackTest's own trade_update only runs with a trade open.
+        """
 
-        ## create all derived data and indicatirs here 
+        hooks = self.hooks
+        open_hooks = [ hooks[name] for name in BAR_HOOKS[:3] if name in hooks ]
+        exit_close = hooks.get('exit_CLOSE')
+        trade_update = hooks.get('trade_update')
+        update_flat = trade_update is None or getattr(trade_update, '__func__', None) is not BackTest.trade_update
+        entry_close = hooks.get('entry_CLOSE')
+        limit_hooks = [ hooks[name] for name in LIMIT_HOOKS if name in hooks ]
+        timeframes, htf = self.timeframes, self.htf
+        record = self.record_backtest_data
 
+        def step(i, cur_dt, bar, ref_bar):
+            self.backtest_enabled = i >= start_index
+
+            for tf in timeframes:
+                htf[tf.timeframe] = tf.bar(i)
+
+            ## exit_OPEN, entry_OPEN, calc_strategy_analytics
+            for hook in open_hooks:
+                hook(cur_dt, bar, ref_bar)
+
+            if self.current_trade is not None:
+                self.current_trade.Duration += 1
+
+            if exit_close is not None:
+                exit_close(cur_dt, bar, ref_bar)
+            if trade_update is not None and (update_flat or self.current_trade is not None):
+                trade_update(cur_dt, bar, ref_bar)
+            if entry_close is not None:
+                entry_close(cur_dt, bar, ref_bar)
+
+            ## record trade info for the day.
+            mtm = record(bar)
+
+            ## reset trade
+            trade = self.current_trade
+            if trade is not None and trade.Exit:
+                self.wallet += mtm
+                self.current_trade = trade = None
+
+            if trade is None:
+                self.high_marker = self.low_marker = None
+                for hook in limit_hooks:
+                    hook()
+
+        return step
 
     def run(self):
 
         self.metrics = None
 
+        ## position the security cursor - skip everything before the
+        ## warm-up window when one is configured
+        if self.start_dt and self.warmup_bars is not None:
+            self.security.seek(self.start_dt, warmup_bars=self.warmup_bars)
+        else:
+            self.security.reset()
+        self.trade_series = self.new_series()
+
+        ## row index of the first tradeable bar - an int compare per bar
+        start_index = 0
+        if self.start_dt:
+            start_index = self.security.index_range(self.start_dt)[0]
+
+        step = self.bar_step(start_index)
+
         # i = integer index
-        # cur_dt = bar datetime = datetime.strptime(dt)
+        # cur_dt = bar datetime.date
+        # bar['Date'] = int day ordinal (see security.format_dates)
         # bar = OHLC, etc data.
         while True:
+            ref_bar = None
             try:
-                i, cur_dt, bar = self.security.next_bar()
+                if self.panel is not None:
+                    ## reference bars come pre-aligned from the panel
+                    i, cur_dt, bar, ref_bar = self.panel.next_bar()
+                else:
+                    i, cur_dt, bar = self.security.next_bar()
             except StopIteration:
                 break
 
-            self.backtest_enabled = True 
-            if self.start_dt and cur_dt < self.start_dt:
-                self.backtest_enabled = False 
+            step(i, cur_dt, bar, ref_bar)
 
-            ref_bar = None
-            if self.ref_index is not None:
-                ref_tuple = self.ref_index.fetch_bar(bar['Date'])
-                ## unpack index, date, and bar from reference
-                ref_i, ref_cur_dt, ref_bar = ref_tuple
-            
-            self.exit_OPEN(cur_dt, bar, ref_bar)
-            self.entry_OPEN(cur_dt, bar, ref_bar)
 
-            ## do analytics here
+    def run_vectorized(self):
 
-            self.calc_strategy_analytics(cur_dt, bar, ref_bar )
-
-
-            # collect all analytics, but don't start trading until we
-            # hit the the start_from_dt trading date
-
-            if not self.FLAT:
-                self.current_trade['Duration'] += 1
-                ## self.current_trade['CurDate'] = cur_dt.strftime("%Y-%m-%d")
-                ## print(json.dumps(self.current_trade, indent=4))
-
-            self.exit_CLOSE(cur_dt, bar, ref_bar)
-            self.trade_update(cur_dt, bar, ref_bar)
-            self.entry_CLOSE(cur_dt, bar, ref_bar)
+        """
+        array version of run() for long strategies that enter at the
+        Open on entry_signal() and exit on the standard PNL / EXPIRY /
+        STOP_OUT family (see signals.py). the signal, the stdev and the
+        exit of every candidate entry are computed once over the whole
+        history and the engine only steps from trade to trade - no
+        per-bar python. self.trades and self.trade_series come out as
+        run() builds them.
+
+        position sizing goes through enter_trade() and the update_*
+        hooks run once per closed trade, so they should only depend on
+        the wallet / trade state.
+        """
 
+        if type(self).entry_signal is BackTest.entry_signal:
+            raise NotImplementedError(f'{type(self).__name__}: run_vectorized() needs an entry_signal() override')
 
-            ## record trade info for the day.
-            backtest_dict = self.record_backtest_data( bar )
-            if self.backtest_enabled:
-                self.trade_series.append( backtest_dict )
+        self.metrics = None
+        assert(self.panel is None or self.panel.policy != MissingPolicy.SKIP)
+
+        if self.start_dt and self.warmup_bars is not None:
+            self.security.seek(self.start_dt, warmup_bars=self.warmup_bars)
+        else:
+            self.security.reset()
+        self.trade_series = self.new_series()
+
+        ## the bars run() would step through, as column slices
+        lo, hi = self.security.remaining_range()
+        columns = self.security.remaining_columns()
+        n = hi - lo
+        start_index = 0
+        if self.start_dt:
+            start_index = max(self.security.index_range(self.start_dt)[0] - lo, 0)
+
+        dates = columns['Date']
+        open_, high, close = columns['Open'], columns['High'], columns['Close']
+        settings = self.config.get('settings', {})
+        duration = settings['duration']
+        vol = rolling_stdev(close, settings.get('StDev', 50))
+
+        signal = numpy.asarray(self.entry_signal(columns), dtype=bool)
+        candidates = numpy.flatnonzero(signal[start_index:]) + start_index
+        ## exits don't depend on sizing - resolve them for all candidates at once
+        exit_bars, exit_codes = first_passage(candidates, open_[candidates], open_, high, close, vol, duration)
+
+        ## per bar state filled trade by trade: row of the trade held (-1 flat)
+        held = numpy.full(n, -1, dtype=numpy.int64)
+        stop_level = numpy.full(n, numpy.nan)
+        entries, lasts, exits, labels, trades = [], [], [], [], []
+        wallets = [self.wallet]
+
+        limit_hooks = [ self.hooks[name] for name in LIMIT_HOOKS if name in self.hooks ]
+        for hook in limit_hooks:
+            hook()
+
+        free = 0
+        while True:
+            c = int(numpy.searchsorted(candidates, free))
+            if c == len(candidates):
+                break
+            i = int(candidates[c])
 
-            ## reset trade
-            if self.CLOSED:
-                self.wallet += backtest_dict['MTM']
+            self.current_trade = self.enter_trade( TradeType.BUY, dates[i], self.security, open_[i], label=self.entry_label, index=lo + i )
+            if not self.LONG:
                 self.current_trade = None
-            
-            if self.FLAT:
-                self.high_marker = self.low_marker = None
-                self.update_position_limit()
-                self.update_wallet_alloc()
-                self.update_dollar_limit()
+                free = i + 1
+                continue
+
+            trade = self.current_trade
+            j = int(exit_bars[c])
+            last = j if j >= 0 else n - 1
+            held[i:last + 1] = len(trades)
+            trade.Duration = last - i + 1
+            entries.append(i)
+            lasts.append(last)
+            trades.append(trade)
+
+            if j < 0:
+                ## still open when the data ends - as run() leaves it
+                break
 
+            label = EXIT_LABELS[exit_codes[c]]
+            self.exit_trade( dates[j], self.security, close[j], label=label, index=lo + j )
+            self.wallet += self.mark_to_market( close[j] )
+            wallets.append(self.wallet)
+            exits.append(j)
+            labels.append(label)
+            self.current_trade = None
+
+            for hook in limit_hooks:
+                hook()
+            free = j + 1
+
+        ## StopLevel path of the trades taken, in one pass
+        if trades:
+            stops = trailing_stops(entries, open_, high, vol, duration + 1)
+            for t, (i, last) in enumerate(zip(entries, lasts)):
+                stop_level[i:last + 1] = stops[t, :last - i + 1]
+                trades[t].StopLevel = float(stops[t, last - i])
+
+        self.high_marker = self.low_marker = None
+        self._vector_series(columns, start_index, held, stop_level, trades, entries, exits, labels, wallets)
+
+    def _vector_series(self, columns, start_index, held, stop_level, trades, entries, exits, labels, wallets):
+        ## trade_series for run_vectorized - the record_backtest_data
+        ## fields, written column by column
+        n = len(held)
+        in_trade = held >= 0
+        k = numpy.where(in_trade, held, 0)
+
+        entry = numpy.array([ t.Entry for t in trades ] or [0.0], dtype=numpy.float64)[k]
+        position = numpy.array([ t.Position for t in trades ] or [0], dtype=numpy.int64)[k]
+        m = self.security.tick_value / self.security.tick_size
+        mtm = numpy.where(in_trade, m * (columns['Close'] - entry) * position, 0.0)
+
+        ## wallet before each bar's close: the cash after every trade closed earlier
+        closed = numpy.searchsorted(numpy.array(exits, dtype=numpy.int64), numpy.arange(n), side='left')
+        equity = numpy.array(wallets)[closed] + mtm
+
+        series = self.trade_series
+        fields = dict(Date=columns['Date'], Equity=equity)
+        if series.full:
+            entry_bar = numpy.zeros(n, dtype=bool)
+            entry_bar[entries] = True
+            exit_bar = numpy.zeros(n, dtype=bool)
+            exit_bar[exits] = True
+            ex_signal = numpy.zeros(n, dtype=numpy.int32)
+            ex_signal[exits] = [ series.code(label) for label in labels ]
+
+            fields.update(Close=columns['Close'],
+                          InSignal=numpy.where(entry_bar, series.code(self.entry_label), 0),
+                          Entry=numpy.where(entry_bar, entry, numpy.nan),
+                          ExSignal=ex_signal,
+                          Exit=numpy.where(exit_bar, columns['Close'], numpy.nan),
+                          Position=numpy.where(in_trade, position, numpy.nan),
+                          StopLevel=numpy.where(in_trade, stop_level, numpy.nan),
+                          MTM=mtm)
+        if series.timed:
+            fields['Time'] = columns['Timestamp']
+        if series.contracts:
+            names, index = numpy.unique(columns['Contract'], return_inverse=True)
+            fields['Contract'] = numpy.array([ series.code(name) for name in names.tolist() ], dtype=numpy.int32)[index]
+
+        series.extend(**{ name: numpy.asarray(values)[start_index:] for name, values in fields.items() })
 
     def run_and_report(self):
 
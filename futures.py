@@ -0,0 +1,211 @@
+from enum import Enum
+import glob
+import os
+import numpy
+import pandas
+import security
+from security import BarData, load_columns, load_built_columns, data_file, window_columns, format_dates, COMPRESSED_SUFFIXES
+
+
+class RollRule(str, Enum):
+    VOLUME = 'VOLUME'                           ## roll when the next contract out-trades the current one
+    OPEN_INTEREST = 'OPEN_INTEREST'             ## roll on the open interest crossover
+    DAYS_BEFORE_EXPIRY = 'DAYS_BEFORE_EXPIRY'   ## roll a fixed number of bars before expiry
+
+
+class RollAdjust(str, Enum):
+    NONE = 'NONE'       ## raw stitched prices
+    BACK = 'BACK'       ## shift history by the price gap at each roll
+    RATIO = 'RATIO'     ## scale history by the price ratio at each roll
+
+
+"""
+continuous futures series built from per-contract files:
+
+    DATA_DIR/<root>/<contract>.csv   - Date,Open,High,Low,Close,Volume[,Open Interest]
+    DATA_DIR/<root>/expiries.csv     - optional Contract,Expiry
+                                       (default expiry = last date in the file)
+
+contract files may also be compressed (<contract>.csv.gz, .zst, .xz, .bz2).
+
+the stitched series is cached in the binary store. RAW bars are the
+unadjusted prices of the contract held, the default TOTAL_RETURN view
+carries the roll adjusted prices, and bar['Contract'] names the contract
+held on each bar.
+
+symbol definition:
+    {
+        "symbol": "ES_C",
+        "sec_type": "FUTURE",
+        "tick_size": 0.25,
+        "tick_value": 12.50,
+        "margin_req": 12000,
+        "continuous": { "root": "ES", "roll": "VOLUME", "days": 5, "adjust": "BACK" }
+    }
+"""
+
+
+def contract_files(root):
+    ## one file per contract - a plain csv wins over a compressed copy
+    files = dict()
+    for suffix in [''] + COMPRESSED_SUFFIXES:
+        for fn in glob.glob(os.path.join(security.DATA_DIR, root, '*.csv' + suffix)):
+            name = _contract_name(fn)
+            if name != 'expiries':
+                files.setdefault(name, fn)
+    return sorted(files.values())
+
+
+def _contract_name(fn):
+    name = os.path.basename(fn)
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return os.path.splitext(name)[0]
+
+
+def load_expiries(root, contracts):
+    ## contract name -> expiry (datetime64[D])
+    expiries = { name: cols['Date'][-1] for name, cols in contracts.items() }
+    fn = data_file(os.path.join(security.DATA_DIR, root, 'expiries.csv'))
+    if os.path.exists(fn):
+        df = pandas.read_csv(fn)
+        for name, expiry in zip(df['Contract'], df['Expiry']):
+            if name in expiries:
+                expiries[name] = numpy.datetime64(expiry, 'D')
+    return expiries
+
+
+def _roll_switches(metric, has_data, last_idx, roll, days):
+    ## switch[k] = first calendar index holding contract k+1
+    n_contracts = metric.shape[0]
+    switches = []
+    start = int(numpy.argmax(has_data[0]))
+    for k in range(n_contracts - 1):
+        last = int(last_idx[k])
+        if roll == RollRule.DAYS_BEFORE_EXPIRY:
+            s = last - days + 1
+        else:
+            ## crossover seen at the close of bar j - hold the next contract from j+1
+            window = slice(start, last + 1)
+            crossed = metric[k + 1, window] > metric[k, window]
+            if crossed.any():
+                s = start + int(numpy.argmax(crossed)) + 1
+            else:
+                s = last + 1
+        s = max(s, start + 1)
+        switches.append(s)
+        start = s
+    return numpy.array(switches, dtype=numpy.int64)
+
+
+def build_continuous(root, roll=RollRule.VOLUME, days=5, adjust=RollAdjust.BACK):
+    roll = RollRule(roll)
+    adjust = RollAdjust(adjust)
+
+    contracts = { _contract_name(fn): load_columns(fn, f'{root}/{_contract_name(fn)}') for fn in contract_files(root) }
+    assert(len(contracts) > 0)
+    expiries = load_expiries(root, contracts)
+    names = sorted(contracts.keys(), key=lambda name: expiries[name])
+
+    ## union trading calendar and contract x date matrices (NaN = no bar)
+    calendar = numpy.unique(numpy.concatenate([ contracts[name]['Date'] for name in names ]))
+    n_contracts, n_dates = len(names), len(calendar)
+
+    def _matrix(col):
+        m = numpy.full((n_contracts, n_dates), numpy.nan)
+        for k, name in enumerate(names):
+            cols = contracts[name]
+            if col in cols:
+                m[k, numpy.searchsorted(calendar, cols['Date'])] = cols[col]
+        return m
+
+    prices = { col: _matrix(col) for col in ['Open', 'High', 'Low', 'Close', 'Volume', 'Open Interest'] }
+    has_data = ~numpy.isnan(prices['Close'])
+
+    last_idx = numpy.searchsorted(calendar, numpy.array([ expiries[name] for name in names ]), side='right') - 1
+    metric = prices['Open Interest'] if roll == RollRule.OPEN_INTEREST else prices['Volume']
+    switches = _roll_switches(metric, has_data, last_idx, roll, days)
+
+    bars = numpy.arange(n_dates)
+    held = numpy.searchsorted(switches, bars, side='right')
+
+    ## roll gaps measured on the close before each switch, when both trade
+    back = numpy.zeros(n_dates)
+    ratio = numpy.ones(n_dates)
+    for k, s in enumerate(switches):
+        if s < 1 or s >= n_dates:
+            continue
+        old_close = prices['Close'][k, s - 1]
+        new_close = prices['Close'][k + 1, s - 1]
+        if numpy.isnan(old_close) or numpy.isnan(new_close):
+            continue
+        back[s - 1] += new_close - old_close
+        ratio[s - 1] *= new_close / old_close
+
+    ## bars up to and including s-1 carry every later roll adjustment
+    offset = numpy.cumsum(back[::-1])[::-1]
+    factor = numpy.cumprod(ratio[::-1])[::-1]
+
+    keep = has_data[held, bars]
+    idx = bars[keep]
+    held = held[keep]
+
+    columns = dict(Date=calendar[idx])
+    for col in ['Open', 'High', 'Low', 'Close', 'Volume', 'Open Interest']:
+        columns[col] = prices[col][held, idx]
+
+    for col in ['Open', 'High', 'Low', 'Close']:
+        raw = columns[col]
+        if adjust == RollAdjust.BACK:
+            adjusted = raw + offset[idx]
+        elif adjust == RollAdjust.RATIO:
+            adjusted = raw * factor[idx]
+        else:
+            adjusted = raw.copy()
+        columns[f'Adj {col}'] = adjusted
+
+    columns['Contract'] = numpy.array(names)[held]
+    return columns
+
+
+def get_continuous_data(symbol, spec, start_dt=None, end_dt=None, warmup_bars=0, reload=False):
+    ## registry + binary cache front end for build_continuous
+    root = spec['root']
+    roll = RollRule(spec.get('roll', RollRule.VOLUME))
+    days = int(spec.get('days', 5))
+    adjust = RollAdjust(spec.get('adjust', RollAdjust.BACK))
+
+    ## the build spec is part of the key, as it is of the cache key
+    key = (symbol, root, roll.value, days, adjust.value, str(start_dt), str(end_dt), warmup_bars)
+    data = security._REGISTRY.get(key)
+    if data is None or reload:
+        sources = contract_files(root)
+        expiries_fn = data_file(os.path.join(security.DATA_DIR, root, 'expiries.csv'))
+        if os.path.exists(expiries_fn):
+            sources.append(expiries_fn)
+
+        cache_key = f'{root}/continuous.{roll.value}.{days}.{adjust.value}'
+        columns = load_built_columns(cache_key, sources, lambda: build_continuous(root, roll, days, adjust))
+        if start_dt is not None or end_dt is not None:
+            columns = window_columns(columns, start_dt, end_dt, warmup_bars)
+        data = BarData(columns)
+        security._REGISTRY[key] = data
+    return data
+
+
+def roll_calendar(sec):
+    ## one row per roll: first bar on the new contract, the contracts involved
+    ## and the adjustment applied to everything before it
+    c = sec._data.columns
+    contract = c['Contract']
+    rolls = numpy.flatnonzero(contract[1:] != contract[:-1]) + 1
+
+    offset = c['Adj Close'] - c['Close']
+    factor = c['Adj Close'] / c['Close']
+    return pandas.DataFrame(dict(Date=format_dates(sec._data.ordinals[rolls]),
+                                 From=contract[rolls - 1],
+                                 To=contract[rolls],
+                                 Gap=offset[rolls - 1] - offset[rolls],
+                                 Ratio=factor[rolls - 1] / factor[rolls]))
+
@@ -0,0 +1,132 @@
+from enum import Enum
+import os
+import numpy
+import pandas
+import security
+from security import Bar, load_built_columns, data_file, to_ordinal, date_ordinals
+
+
+class OptionRight(str, Enum):
+    CALL = 'C'
+    PUT = 'P'
+
+
+## stored as int8 codes so the chain sorts (date, expiry, right, strike)
+RIGHT_CODES = { OptionRight.CALL: 0, OptionRight.PUT: 1 }
+
+## quote columns kept when the file has them
+QUOTE_COLUMNS = ['Bid', 'Ask', 'Last', 'Volume', 'Open Interest', 'Underlying', 'IV']
+
+
+"""
+option chain store for SecType.OPTION
+
+    DATA_DIR/<symbol>_options.csv - Date,Expiry,Strike,Right[,Bid,Ask,Last,Volume,Open Interest,...]
+
+rows are sorted once by (Date, Expiry, Right, Strike) and held as columnar
+arrays in the binary cache. day_starts[k]:day_starts[k+1] is the block of
+rows quoted on day_ords[k], so a day's chain is a zero-copy slice and every
+lookup inside it is a binary search.
+
+Date and Expiry are int32 day ordinals like bar['Date'], so a quote's
+Expiry goes straight back into lookup(), nearest() or enter_trade().
+"""
+
+
+def read_option_columns(fn):
+    df = pandas.read_csv(fn)
+
+    right = df['Right'].astype(str).str.upper().str[0]
+    columns = dict(Date=date_ordinals(df['Date'].to_numpy(dtype='datetime64[D]')),
+                   Expiry=date_ordinals(df['Expiry'].to_numpy(dtype='datetime64[D]')),
+                   Strike=df['Strike'].to_numpy(dtype=numpy.float64),
+                   Right=numpy.where(right == OptionRight.PUT.value, 1, 0).astype(numpy.int8))
+    for col in QUOTE_COLUMNS:
+        if col in df.columns:
+            columns[col] = df[col].to_numpy(dtype=numpy.float64)
+
+    ## lexsort keys: last key is the primary sort
+    order = numpy.lexsort((columns['Strike'], columns['Right'], columns['Expiry'], columns['Date']))
+    return { col: numpy.ascontiguousarray(values[order]) for col, values in columns.items() }
+
+
+class OptionChain():
+    def __init__(self, columns):
+        self.columns = columns
+        self.dates = columns['Date']
+        self.expiries = columns['Expiry']
+        self.strikes = columns['Strike']
+        self.rights = columns['Right']
+
+        ## per-date offsets into the sorted rows
+        starts = numpy.flatnonzero(self.dates[1:] != self.dates[:-1]) + 1
+        self.day_starts = numpy.concatenate([[0], starts, [len(self.dates)]])
+        self.day_ords = self.dates[self.day_starts[:-1]]
+
+    def __len__(self):
+        return len(self.dates)
+
+    def day_slice(self, dt):
+        ## [lo, hi) rows quoted on dt - empty when dt has no chain
+        k = int(numpy.searchsorted(self.day_ords, to_ordinal(dt)))
+        if k >= len(self.day_ords) or self.day_ords[k] != to_ordinal(dt):
+            return 0, 0
+        return int(self.day_starts[k]), int(self.day_starts[k + 1])
+
+    def chain(self, dt):
+        ## every quote on dt as zero-copy column views
+        lo, hi = self.day_slice(dt)
+        return { col: values[lo:hi] for col, values in self.columns.items() }
+
+    def _block(self, lo, hi, expiry_ord, right_code):
+        ## rows of one (expiry, right) block inside a day slice
+        a = lo + int(numpy.searchsorted(self.expiries[lo:hi], expiry_ord, side='left'))
+        b = lo + int(numpy.searchsorted(self.expiries[lo:hi], expiry_ord, side='right'))
+        c = a + int(numpy.searchsorted(self.rights[a:b], right_code, side='left'))
+        d = a + int(numpy.searchsorted(self.rights[a:b], right_code, side='right'))
+        return c, d
+
+    def nearest(self, dt, strike, min_expiry=None, right=OptionRight.CALL):
+        ## row of the strike closest to strike in the first expiry >= min_expiry
+        lo, hi = self.day_slice(dt)
+        if lo == hi:
+            return None
+
+        right_code = RIGHT_CODES[OptionRight(right)]
+        min_ord = to_ordinal(min_expiry) if min_expiry is not None else to_ordinal(dt)
+        e = lo + int(numpy.searchsorted(self.expiries[lo:hi], min_ord, side='left'))
+        while e < hi:
+            expiry_ord = self.expiries[e]
+            a, b = self._block(lo, hi, expiry_ord, right_code)
+            if a < b:
+                k = a + int(numpy.searchsorted(self.strikes[a:b], strike))
+                if k == b or (k > a and strike - self.strikes[k - 1] <= self.strikes[k] - strike):
+                    k -= 1
+                return k
+            ## no contracts of that right in this expiry - try the next one
+            e = lo + int(numpy.searchsorted(self.expiries[lo:hi], expiry_ord, side='right'))
+        return None
+
+    def lookup(self, dt, expiry, strike, right=OptionRight.CALL):
+        ## exact row for one contract on dt, or None
+        lo, hi = self.day_slice(dt)
+        a, b = self._block(lo, hi, to_ordinal(expiry), RIGHT_CODES[OptionRight(right)])
+        k = a + int(numpy.searchsorted(self.strikes[a:b], strike))
+        if k < b and self.strikes[k] == strike:
+            return k
+        return None
+
+    def quote(self, index):
+        return Bar(self.columns, index)
+
+
+def get_option_chain(symbol, reload=False):
+    key = (symbol, 'options')
+    chain = security._REGISTRY.get(key)
+    if chain is None or reload:
+        fn = data_file(os.path.join(security.DATA_DIR, f'{symbol}_options.csv'))
+        columns = load_built_columns(f'{symbol}/options', [fn], lambda: read_option_columns(fn))
+        chain = OptionChain(columns)
+        security._REGISTRY[key] = chain
+    return chain
+
@@ -0,0 +1,130 @@
+from enum import Enum
+import numpy
+from security import Bar, NO_DATE
+
+
+class MissingPolicy(str, Enum):
+    SKIP = 'SKIP'       ## drop primary bars where any reference has no bar that day
+    FFILL = 'FFILL'     ## carry the last reference bar forward
+    NAN = 'NAN'         ## hand out a bar of NaNs for the missing day
+
+
+class SecurityPanel():
+    def __init__(self, security, ref_securities, policy=MissingPolicy.FFILL):
+
+        """
+        aligns any number of reference securities onto the trading
+        calendar of the primary security - once, up front.
+
+        self.rows[k] = row in reference k used for each primary row (-1 = missing)
+        self.valid = mask of primary rows that survive the missing-date policy
+
+        aligned columns are indexed by the primary row index, so the
+        reference bar for primary bar i is just Bar(aligned_columns, i)
+
+        an intraday primary with a daily reference is aligned on the
+        previous trading day - the day's own daily bar has not closed yet
+        """
+
+        self.security = security
+        self.single = not isinstance(ref_securities, (list, tuple))
+        if self.single:
+            ref_securities = [ref_securities]
+        self.refs = list(ref_securities)
+        self.policy = MissingPolicy(policy)
+
+        self.rows = []
+        self.valid = None
+        ## per reference: AdjustMode -> aligned columns, built on first use
+        self._aligned = []
+
+        self.align()
+
+    def _align_rows(self, ref):
+        ## bar times when both sides are intraday, trading days otherwise
+        primary, other = self.security._data, ref._data
+        if primary.intraday and other.intraday:
+            primary_dates, ref_dates = primary.stamps, other.stamps
+        elif primary.intraday:
+            ## a daily reference bar only closes after the session - intraday
+            ## bars see the last reference day before their own, or with
+            ## SKIP / NAN the reference bar of the previous trading day
+            if self.policy == MissingPolicy.FFILL:
+                return numpy.searchsorted(other.dates, primary.dates, side='left') - 1
+            primary_dates, ref_dates = self._previous_days(primary.dates), other.dates
+        else:
+            primary_dates, ref_dates = primary.dates, other.dates
+
+        if self.policy == MissingPolicy.FFILL:
+            return numpy.searchsorted(ref_dates, primary_dates, side='right') - 1
+
+        pos = numpy.searchsorted(ref_dates, primary_dates, side='left')
+        clipped = numpy.minimum(pos, len(ref_dates) - 1)
+        exact = (pos < len(ref_dates)) & (ref_dates[clipped] == primary_dates)
+        return numpy.where(exact, pos, -1)
+
+    def _previous_days(self, dates):
+        ## previous trading day of each bar, NaT on the first day
+        days = numpy.unique(dates)
+        prev = numpy.concatenate([ numpy.array(['NaT'], dtype=days.dtype), days[:-1] ])
+        return prev[numpy.searchsorted(days, dates)]
+
+    def _align_columns(self, columns, rows):
+        missing = rows < 0
+        take = numpy.where(missing, 0, rows)
+        aligned = dict()
+        for col, values in columns.items():
+            if values.dtype.kind == 'i':
+                ## day ordinals
+                v = values[take]
+                v[missing] = NO_DATE
+            elif values.dtype.kind == 'M':
+                ## intraday timestamps
+                v = values[take]
+                v[missing] = numpy.datetime64('NaT')
+            elif values.dtype.kind in 'USO':
+                ## labels - the Contract held on continuous futures
+                v = values[take]
+                v[missing] = ''
+            else:
+                v = values[take].astype(numpy.float64)
+                v[missing] = numpy.nan
+            aligned[col] = v
+        return aligned
+
+    def align(self):
+        self.valid = numpy.ones(len(self.security._data), dtype=bool)
+        self.rows = []
+        self._aligned = []
+
+        for ref in self.refs:
+            rows = self._align_rows(ref)
+            self.rows.append(rows)
+            self._aligned.append( dict() )
+
+            if self.policy == MissingPolicy.SKIP:
+                self.valid &= rows >= 0
+
+    def aligned(self, k=0):
+        ## aligned column arrays for reference k (respects its adjustment mode)
+        ref = self.refs[k]
+        mode = ref.adjust_mode
+        aligned = self._aligned[k].get(mode)
+        if aligned is None:
+            aligned = self._align_columns(ref._data.view(mode), self.rows[k])
+            self._aligned[k][mode] = aligned
+        return aligned
+
+    def ref_bars(self, i):
+        bars = tuple( Bar(self.aligned(k), i) for k in range(len(self.refs)) )
+        if self.single:
+            return bars[0]
+        return bars
+
+    def next_bar(self):
+        ## drives the primary security and attaches the aligned reference bar(s)
+        while True:
+            i, cur_dt, bar = self.security.next_bar()
+            if self.valid[i]:
+                return i, cur_dt, bar, self.ref_bars(i)
+
@@ -1,6 +1,7 @@
 from datetime import date, datetime
 from indicators import StDev, DataSeries
 from backtest import BackTest, TradeType, DumpFormat
+from signals import shift
 import calendar_calcs
 
 
@@ -18,6 +19,9 @@ class PctBackTest(BackTest):
         self.price_series = DataSeries(derived_len= 20)
         self.holidays = calendar_calcs.load_holidays()
 
+        ## InSignal of trades taken by run_vectorized()
+        self.entry_label = f'PCT{self.threshold}'
+
 
 
     def calc_strategy_analytics(self, cur_dt, bar, ref_bar):
@@ -27,6 +31,14 @@ class PctBackTest(BackTest):
         self.stdev.push(bar['Close'])
 
 
+    def entry_signal(self, columns):
+        ## entry_OPEN over the whole history for run_vectorized():
+        ## yesterday's close to close return at or below the threshold
+        close = columns['Close']
+        rtn = shift(close, 1)/shift(close, 2) - 1
+        return rtn <= self.threshold
+
+
     def exit_OPEN(self, cur_dt, bar, ref_bar=None):
         if self.backtest_disabled:
             return
@@ -0,0 +1,59 @@
+import sys
+import tempfile
+import numpy
+import pandas
+import security
+from security import Security
+from pct_backtest import PctBackTest
+
+
+"""
+run() vs run_vectorized() on synthetic bars - trades and trade_series
+must come out identical, to the last bit
+
+    python vector_check.py [bars]
+"""
+
+
+def synthetic_bars(n, seed=7):
+    rng = numpy.random.default_rng(seed)
+    close = 100 * numpy.exp(numpy.cumsum(rng.normal(0.0003, 0.012, n)))
+    open_ = numpy.append(100, close[:-1]) * (1 + rng.normal(0, 0.004, n))
+    high = numpy.maximum(open_, close) * (1 + numpy.abs(rng.normal(0, 0.006, n)))
+    low = numpy.minimum(open_, close) * (1 - numpy.abs(rng.normal(0, 0.006, n)))
+    dates = pandas.bdate_range('2000-01-03', periods=n)
+    return pandas.DataFrame({ 'Date': dates.strftime('%Y-%m-%d'), 'Open': open_, 'High': high, 'Low': low,
+                              'Close': close, 'Adj Close': close, 'Volume': rng.integers(1e6, 1e7, n) })
+
+
+def check(config):
+    sym_def = { "symbol": "SYN", "sec_type": "ETF", "tick_size": 0.01, "tick_value": 0.01 }
+
+    event = PctBackTest(Security(sym_def), config)
+    event.run()
+    vector = PctBackTest(Security(sym_def), config)
+    vector.run_vectorized()
+
+    same = [ event.trades.frame().equals(vector.trades.frame()),
+             event.trade_series.frame().equals(vector.trade_series.frame()) ]
+    print(config['settings'], len(event.trades), 'trades', 'OK' if all(same) else 'MISMATCH')
+    return all(same)
+
+
+if __name__ == '__main__':
+    bars = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        security.DATA_DIR = data_dir
+        security.CACHE_DIR = ''
+        security.VALIDATE_DATA = 'OFF'
+        synthetic_bars(bars).to_csv(f'{data_dir}/SYN.csv', index=False)
+
+        ok = True
+        for settings in [ dict(StDev=50, Threshold=-0.005, duration=10),
+                          dict(StDev=20, Threshold=-0.01, duration=3),
+                          dict(StDev=10, Threshold=0.0, duration=20) ]:
+            config = { "settings": settings, "wallet": { "cash": 10000, "wallet_alloc_pct": 1, "borrow_margin_pct": 1 } }
+            ok &= check(config)
+
+    sys.exit(0 if ok else 1)
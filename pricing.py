@@ -0,0 +1,185 @@
+import numpy
+
+try:
+    from scipy.special import ndtr as _ndtr
+except ImportError:
+    _ndtr = None
+
+
+"""
+vectorized black-scholes pricing, greeks and implied vol.
+
+every function takes numpy arrays (or scalars) that broadcast together, so
+a whole day's chain - or an entire history - is priced in one call.
+
+    S = underlying price        K = strike
+    T = years to expiry         r = risk free rate (continuous)
+    sigma = volatility          q = dividend yield (continuous)
+    right = 'C' / 'P', the chain's int8 codes (0 = call, 1 = put)
+            or a boolean is-call mask
+"""
+
+DAYS_PER_YEAR = 365.0
+
+
+def norm_pdf(x):
+    return numpy.exp(-0.5 * x * x) / numpy.sqrt(2.0 * numpy.pi)
+
+
+def norm_cdf(x):
+    x = numpy.asarray(x, dtype=numpy.float64)
+    if _ndtr is not None:
+        return _ndtr(x)
+
+    ## abramowitz & stegun 26.2.17 - abs error < 7.5e-8
+    t = 1.0 / (1.0 + 0.2316419 * numpy.abs(x))
+    poly = t * (0.319381530 + t * (-0.356563782 + t * (1.781477937 + t * (-1.821255978 + t * 1.330274429))))
+    upper = norm_pdf(x) * poly
+    return numpy.where(x >= 0, 1.0 - upper, upper)
+
+
+def is_call(right):
+    right = numpy.asarray(right)
+    if right.dtype == bool:
+        return right
+    if right.dtype.kind in 'US':
+        return numpy.char.upper(right.astype(str)) == 'C'
+    return right == 0
+
+
+def _d1_d2(S, K, T, r, sigma, q):
+    vol_t = sigma * numpy.sqrt(T)
+    d1 = (numpy.log(S / K) + (r - q + 0.5 * sigma * sigma) * T) / vol_t
+    return d1, d1 - vol_t
+
+
+def bs_price(S, K, T, r, sigma, right, q=0.0):
+    S, K, T, sigma = (numpy.asarray(v, dtype=numpy.float64) for v in (S, K, T, sigma))
+    call = is_call(right)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        d1, d2 = _d1_d2(S, K, T, r, sigma, q)
+        df_r = numpy.exp(-r * T)
+        df_q = numpy.exp(-q * T)
+        call_px = S * df_q * norm_cdf(d1) - K * df_r * norm_cdf(d2)
+        put_px = K * df_r * norm_cdf(-d2) - S * df_q * norm_cdf(-d1)
+        px = numpy.where(call, call_px, put_px)
+
+    ## expired (or zero vol) contracts are worth their discounted intrinsic value.
+    ## a NaN time, or a NaN vol before expiry, is unknown - not zero - and
+    ## the price stays NaN
+    intrinsic = numpy.where(call, numpy.maximum(S * numpy.exp(-q * T) - K * numpy.exp(-r * T), 0.0),
+                                  numpy.maximum(K * numpy.exp(-r * T) - S * numpy.exp(-q * T), 0.0))
+    unknown = numpy.isnan(T) | (numpy.isnan(sigma) & (T > 0))
+    return numpy.where(unknown, numpy.nan, numpy.where((T > 0) & (sigma > 0), px, intrinsic))
+
+
+def bs_greeks(S, K, T, r, sigma, right, q=0.0):
+    ## dict of delta, gamma, vega (per 1.00 vol), theta (per year), rho
+    S, K, T, sigma = (numpy.asarray(v, dtype=numpy.float64) for v in (S, K, T, sigma))
+    call = is_call(right)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        d1, d2 = _d1_d2(S, K, T, r, sigma, q)
+        df_r = numpy.exp(-r * T)
+        df_q = numpy.exp(-q * T)
+        pdf = norm_pdf(d1)
+        sqrt_t = numpy.sqrt(T)
+
+        delta = numpy.where(call, df_q * norm_cdf(d1), df_q * (norm_cdf(d1) - 1.0))
+        gamma = df_q * pdf / (S * sigma * sqrt_t)
+        vega = S * df_q * pdf * sqrt_t
+        decay = -S * df_q * pdf * sigma / (2.0 * sqrt_t)
+        theta = numpy.where(call,
+                            decay - r * K * df_r * norm_cdf(d2) + q * S * df_q * norm_cdf(d1),
+                            decay + r * K * df_r * norm_cdf(-d2) - q * S * df_q * norm_cdf(-d1))
+        rho = numpy.where(call, K * T * df_r * norm_cdf(d2), -K * T * df_r * norm_cdf(-d2))
+
+    return dict(Delta=delta, Gamma=gamma, Vega=vega, Theta=theta, Rho=rho)
+
+
+def _price_vega(S, K, T, r, sigma, call, q):
+    ## price and vega sharing one d1/d2 evaluation - the implied vol inner loop
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        d1, d2 = _d1_d2(S, K, T, r, sigma, q)
+        df_r = numpy.exp(-r * T)
+        df_q = numpy.exp(-q * T)
+        call_px = S * df_q * norm_cdf(d1) - K * df_r * norm_cdf(d2)
+        ## put from put-call parity
+        put_px = call_px - S * df_q + K * df_r
+        vega = S * df_q * norm_pdf(d1) * numpy.sqrt(T)
+    return numpy.where(call, call_px, put_px), vega
+
+
+def implied_vol(price, S, K, T, r, right, q=0.0, tol=1e-8, max_iter=100, lo=1e-4, hi=5.0):
+
+    """
+    newton-raphson on every contract at once, safeguarded by a bisection
+    bracket: any step that leaves [lo, hi] or stalls on a tiny vega falls
+    back to the bracket midpoint. converged contracts drop out of the
+    working set each iteration. r and q are scalars here. prices outside
+    the no-arbitrage bounds come back as NaN.
+    """
+
+    price, S, K, T, right = numpy.broadcast_arrays(*(numpy.asarray(v) for v in (price, S, K, T, right)))
+    shape = price.shape
+    price, S, K, T = (v.astype(numpy.float64).ravel() for v in (price, S, K, T))
+    call = is_call(right).ravel()
+
+    floor = bs_price(S, K, T, r, numpy.full(price.shape, lo), call, q)
+    cap = bs_price(S, K, T, r, numpy.full(price.shape, hi), call, q)
+    valid = (T > 0) & numpy.isfinite(price) & (price >= floor) & (price <= cap)
+
+    out = numpy.full(price.shape, numpy.nan)
+    idx = numpy.flatnonzero(valid)
+    p_, S_, K_, T_, call_ = price[idx], S[idx], K[idx], T[idx], call[idx]
+    sigma = numpy.full(len(idx), 0.2)
+    low = numpy.full(len(idx), lo)
+    high = numpy.full(len(idx), hi)
+
+    for i in range(max_iter):
+        px, vega = _price_vega(S_, K_, T_, r, sigma, call_, q)
+        diff = px - p_
+
+        done = numpy.abs(diff) <= tol
+        out[idx[done]] = sigma[done]
+        keep = ~done
+        idx, p_, S_, K_, T_, call_ = idx[keep], p_[keep], S_[keep], K_[keep], T_[keep], call_[keep]
+        sigma, low, high, diff, vega = sigma[keep], low[keep], high[keep], diff[keep], vega[keep]
+        if len(idx) == 0:
+            break
+
+        ## tighten the bracket - price is increasing in vol
+        high = numpy.where(diff > 0, sigma, high)
+        low = numpy.where(diff < 0, sigma, low)
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            step = sigma - diff / vega
+        bad = ~numpy.isfinite(step) | (step < low) | (step > high)
+        sigma = numpy.where(bad, 0.5 * (low + high), step)
+
+    ## anything left after max_iter keeps its best bracketed estimate
+    out[idx] = sigma
+    return out.reshape(shape)
+
+
+def price_chain(chain, S, r=0.0, q=0.0):
+
+    """
+    mid, implied vol, theoretical price and greeks for one day's chain
+    (options.OptionChain.chain(dt)) in a single call. S is the
+    underlying price that day.
+    """
+
+    ## Date / Expiry are day ordinals - their difference is calendar days
+    T = (chain['Expiry'].astype(numpy.float64) - chain['Date']) / DAYS_PER_YEAR
+    if 'Bid' in chain and 'Ask' in chain:
+        mid = 0.5 * (chain['Bid'] + chain['Ask'])
+    else:
+        mid = chain['Last']
+
+    iv = implied_vol(mid, S, chain['Strike'], T, r, chain['Right'], q)
+    result = dict(Mid=mid, T=T, IV=iv, Theo=bs_price(S, chain['Strike'], T, r, iv, chain['Right'], q))
+    result.update( bs_greeks(S, chain['Strike'], T, r, iv, chain['Right'], q) )
+    return result
+
@@ -0,0 +1,175 @@
+from enum import Enum
+import hashlib
+import json
+import os
+import numpy
+import pandas
+import security
+from security import symbol_columns, symbol_file, format_dates, to_ordinal, _cache_dir, _tmp_suffix
+
+
+class Issue(str, Enum):
+    DUPLICATE_DATE = 'DUPLICATE_DATE'       ## same date (bar time intraday) as the row before
+    UNSORTED_DATE = 'UNSORTED_DATE'         ## earlier than the row before
+    BAD_PRICE = 'BAD_PRICE'                 ## zero, negative or NaN open/high/low/close
+    HIGH_LOW = 'HIGH_LOW'                   ## High < Low
+    OUTSIDE_RANGE = 'OUTSIDE_RANGE'         ## Open or Close outside [Low, High]
+    BAD_VOLUME = 'BAD_VOLUME'               ## negative or NaN volume
+    MISSING_SESSION = 'MISSING_SESSION'     ## weekday, not a holiday, no bar (Row = -1)
+
+
+class Validate(str, Enum):
+    OFF = 'OFF'
+    WARN = 'WARN'       ## print a summary the first time a symbol is loaded
+    STRICT = 'STRICT'   ## refuse to load data with issues
+
+
+## bump when the checks change so cached reports are redone
+QUALITY_VERSION = 1
+
+
+"""
+data quality scan
+
+every check is one vectorized pass over the loaded columns. the report
+is a DataFrame of (Row, Date, Issue) - Row is the row in the csv's data
+(-1 for a missing session) - cached next to the binary columns as
+CACHE_DIR/<symbol>/quality.json and only redone when the file or the
+holiday calendar changes.
+"""
+
+
+def _holiday_ordinals(holidays):
+    if holidays is None:
+        return None
+    return numpy.unique(numpy.array([ to_ordinal(h) for h in holidays ], dtype=numpy.int64))
+
+
+def scan_columns(columns, holidays=None):
+    ## holidays = iterable of dates / 'YYYY-MM-DD' / day ordinals. the
+    ## missing session check only runs when a calendar is given
+    rows, issues = [], []
+
+    def _flag(mask, issue, offset=0):
+        found = numpy.flatnonzero(mask) + offset
+        rows.append(found)
+        issues.append(numpy.full(len(found), issue.value, dtype=object))
+
+    ordinals = columns['Date'].astype('datetime64[D]').view(numpy.int64)
+    keys = columns['Timestamp'].view(numpy.int64) if 'Timestamp' in columns else ordinals
+    _flag(keys[1:] == keys[:-1], Issue.DUPLICATE_DATE, 1)
+    _flag(keys[1:] < keys[:-1], Issue.UNSORTED_DATE, 1)
+
+    o, h, l, c = (columns[col] for col in ['Open', 'High', 'Low', 'Close'])
+    with numpy.errstate(invalid='ignore'):
+        bad = ~(numpy.isfinite(o) & numpy.isfinite(h) & numpy.isfinite(l) & numpy.isfinite(c))
+        bad |= (o <= 0) | (h <= 0) | (l <= 0) | (c <= 0)
+        _flag(bad, Issue.BAD_PRICE)
+        _flag(h < l, Issue.HIGH_LOW)
+        _flag((o < l) | (o > h) | (c < l) | (c > h), Issue.OUTSIDE_RANGE)
+
+        v = columns['Volume']
+        _flag(~numpy.isfinite(v) | (v < 0), Issue.BAD_VOLUME)
+
+    dates = [ ordinals[numpy.concatenate(rows)] ]
+    hols = _holiday_ordinals(holidays)
+    if hols is not None and len(ordinals) > 0:
+        span = numpy.arange(ordinals.min(), ordinals.max() + 1)
+        ## 1970-01-01 was a thursday: (ordinal + 3) % 7 is 0 on mondays
+        weekday = (span + 3) % 7 < 5
+        missing = span[weekday & ~numpy.isin(span, hols) & ~numpy.isin(span, ordinals)]
+        rows.append(numpy.full(len(missing), -1, dtype=numpy.int64))
+        issues.append(numpy.full(len(missing), Issue.MISSING_SESSION.value, dtype=object))
+        dates.append(missing)
+
+    report = pandas.DataFrame(dict(Row=numpy.concatenate(rows).astype(numpy.int64),
+                                   Date=numpy.concatenate(dates).astype(numpy.int64),
+                                   Issue=numpy.concatenate(issues)))
+    report = report.sort_values(['Date', 'Row'], kind='stable').reset_index(drop=True)
+    report['Date'] = format_dates(report['Date'].to_numpy())
+    return report
+
+
+def _fingerprint(fn, holidays):
+    st = os.stat(fn)
+    hols = _holiday_ordinals(holidays)
+    calendar = None if hols is None else hashlib.sha1(hols.tobytes()).hexdigest()
+    return dict(version=QUALITY_VERSION, size=st.st_size, mtime_ns=st.st_mtime_ns, holidays=calendar)
+
+
+def _read_report(symbol, fingerprint):
+    try:
+        with open(os.path.join(_cache_dir(symbol), 'quality.json')) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('fingerprint') != fingerprint:
+        return None
+    return pandas.DataFrame(cached['issues'], columns=['Row', 'Date', 'Issue'])
+
+
+def _write_report(symbol, fingerprint, report):
+    path = _cache_dir(symbol)
+    try:
+        os.makedirs(path, exist_ok=True)
+        tmp = os.path.join(path, f'quality.{_tmp_suffix()}.json')
+        with open(tmp, 'w') as f:
+            json.dump(dict(fingerprint=fingerprint, issues=report.to_dict(orient='list')), f)
+        os.replace(tmp, os.path.join(path, 'quality.json'))
+    except OSError:
+        pass
+
+
+_HOLIDAYS = dict()
+
+
+def default_holidays():
+    ## the exchange calendar the backtests use, when it is installed.
+    ## loaded once per process
+    if 'calendar' not in _HOLIDAYS:
+        try:
+            import calendar_calcs
+            _HOLIDAYS['calendar'] = calendar_calcs.load_holidays()
+        except ImportError:
+            _HOLIDAYS['calendar'] = None
+    return _HOLIDAYS['calendar']
+
+
+def get_quality_report(symbol, holidays=None, reload=False):
+    ## report for DATA_DIR/<symbol>.csv[.gz ...] - scanned once per file fingerprint
+    fn = symbol_file(symbol)
+    fingerprint = _fingerprint(fn, holidays)
+
+    key = (symbol, 'quality')
+    hit = security._REGISTRY.get(key)
+    if hit is not None and hit[0] == fingerprint and not reload:
+        return hit[1]
+
+    report = None
+    if security.CACHE_DIR and not reload:
+        report = _read_report(symbol, fingerprint)
+    if report is None:
+        ## the columns get_bar_data maps - no second read of the file
+        report = scan_columns(symbol_columns(symbol, reload), holidays)
+        if security.CACHE_DIR:
+            _write_report(symbol, fingerprint, report)
+
+    security._REGISTRY[key] = (fingerprint, report)
+    return report
+
+
+def validate(symbol, mode=Validate.WARN):
+    ## load time hook for Security - returns the report (None when OFF)
+    mode = Validate(mode)
+    if mode == Validate.OFF:
+        return None
+
+    first = (symbol, 'quality') not in security._REGISTRY
+    report = get_quality_report(symbol, default_holidays())
+    if len(report) > 0:
+        counts = ', '.join(f'{issue} {n}' for issue, n in report['Issue'].value_counts().items())
+        if mode == Validate.STRICT:
+            raise ValueError(f'{symbol}: data quality issues - {counts}')
+        if first:
+            print(f'{symbol}: data quality issues - {counts} (see Security.quality)')
+    return report
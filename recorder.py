@@ -0,0 +1,226 @@
+from enum import Enum
+import numpy
+import pandas
+from security import NO_DATE
+
+
+class SeriesMode(str, Enum):
+    FULL = 'FULL'       ## every record_backtest_data field
+    EQUITY = 'EQUITY'   ## Date (+ Time intraday) and Equity only
+
+
+"""
+per bar backtest series and closed trade ledger
+
+rows are written by index into one preallocated numpy structured array,
+sized from the bar count of the run - nothing is allocated per bar.
+blank prices / positions are NaN. the string columns (InSignal,
+ExSignal, Contract) are int codes into one label table, 0 = ''.
+
+    array()     zero-copy structured array view of the rows written
+    column(c)   zero-copy view of one column
+    frame()     DataFrame with the labels decoded - Date stays a day ordinal
+
+closed trades go into a TradeLedger the same way, one row per trade in
+a structured array that doubles when it fills - option trades add the
+contract as Expiry (day ordinal), Strike and a coded Right. the live
+position is a slotted Trade.
+"""
+
+
+FULL_FIELDS = [('Date', numpy.int32), ('Close', numpy.float64), ('InSignal', numpy.int32),
+               ('Entry', numpy.float64), ('ExSignal', numpy.int32), ('Exit', numpy.float64),
+               ('Position', numpy.float64), ('StopLevel', numpy.float64),
+               ('MTM', numpy.float64), ('Equity', numpy.float64)]
+
+EQUITY_FIELDS = [('Date', numpy.int32), ('Equity', numpy.float64)]
+
+## label coded columns
+CODED_FIELDS = ['InSignal', 'ExSignal', 'Contract', 'Right']
+
+
+class Labels():
+    def __init__(self):
+        ## label table of the coded columns, code 0 = ''
+        self.labels = ['']
+        self._codes = {'': 0}
+
+    def code(self, label):
+        ## label -> int code, added to the table the first time it is seen
+        c = self._codes.get(label)
+        if c is None:
+            c = self._codes[label] = len(self.labels)
+            self.labels.append(label)
+        return c
+
+    def _frame(self, rows):
+        labels = numpy.array(self.labels, dtype=object)
+        return pandas.DataFrame({ name: labels[rows[name]] if name in CODED_FIELDS else rows[name]
+                                  for name in rows.dtype.names })
+
+
+class SeriesRecorder(Labels):
+    def __init__(self, size, mode=SeriesMode.FULL, timed=False, contracts=False):
+
+        """
+        size = most rows that will be recorded (bars in the run)
+        timed = intraday, add the bar Time column
+        contracts = continuous futures, add the Contract held column
+        """
+
+        self.mode = SeriesMode(mode)
+        self.timed = timed
+        self.contracts = contracts
+
+        fields = list(FULL_FIELDS if self.mode == SeriesMode.FULL else EQUITY_FIELDS)
+        if timed:
+            fields.append(('Time', 'datetime64[s]'))
+        if contracts:
+            fields.append(('Contract', numpy.int32))
+
+        super().__init__()
+        self._rows = numpy.zeros(size, dtype=fields)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def full(self):
+        return self.mode == SeriesMode.FULL
+
+    def record(self, date, close, mtm, equity, in_signal='', entry=numpy.nan, ex_signal='',
+               exit=numpy.nan, position=numpy.nan, stop=numpy.nan, time=None, contract=None):
+        if self.full:
+            row = (date, close, self.code(in_signal), entry, self.code(ex_signal), exit, position, stop, mtm, equity)
+        else:
+            row = (date, equity)
+        if self.timed:
+            row += (time,)
+        if self.contracts:
+            row += (self.code(contract),)
+
+        self._rows[self.n] = row
+        self.n += 1
+
+    def extend(self, **columns):
+        ## bulk write of equal length column arrays - labels coded columns
+        ## are given as codes. fields not given keep their blank value
+        count = len(columns['Date'])
+        rows = self._rows[self.n:self.n + count]
+        assert(len(rows) == count)
+
+        blank = [ name for name in rows.dtype.names if rows.dtype[name].kind == 'f' ]
+        for name in blank:
+            rows[name] = numpy.nan
+        for name, values in columns.items():
+            if name in rows.dtype.names:
+                rows[name] = values
+        self.n += count
+
+    def array(self):
+        return self._rows[:self.n]
+
+    def column(self, name):
+        return self._rows[name][:self.n]
+
+    def frame(self):
+        return self._frame(self.array())
+
+
+class Trade():
+
+    """
+    the live position. fields are attributes - the engine uses those -
+    and trade['StopLevel'] style access works as it did on the old trade
+    dict. fields not set are None; unknown fields raise AttributeError.
+    """
+
+    ## InBar / ExBar: security rows of the entry and exit bars,
+    ## InTime / ExTime: their bar times on intraday data
+    __slots__ = ('InDate', 'Entry', 'Position', 'DollarBase', 'Duration', 'InSignal', 'StopLevel',
+                 'ExDate', 'Exit', 'ExSignal', 'Value', 'TradeRtn', 'PNL', 'Contract', 'IV',
+                 'InBar', 'ExBar', 'InTime', 'ExTime')
+
+    __getitem__ = object.__getattribute__
+    __setitem__ = object.__setattr__
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def __contains__(self, name):
+        return getattr(self, name, None) is not None
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def to_dict(self):
+        return { name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None }
+
+    def __repr__(self):
+        return f'Trade({self.to_dict()})'
+
+
+## closed trade columns, in trades export order
+LEDGER_FIELDS = [('InDate', numpy.int32), ('ExDate', numpy.int32), ('Position', numpy.int64),
+                 ('Duration', numpy.int64), ('InSignal', numpy.int32), ('Entry', numpy.float64),
+                 ('ExSignal', numpy.int32), ('Exit', numpy.float64), ('DollarBase', numpy.float64),
+                 ('Value', numpy.float64), ('TradeRtn', numpy.float64), ('PNL', numpy.float64)]
+
+
+## option contract columns, from Trade.Contract = (expiry, strike, right)
+CONTRACT_FIELDS = [('Expiry', numpy.int32), ('Strike', numpy.float64), ('Right', numpy.int32)]
+
+
+class TradeLedger(Labels):
+    def __init__(self, capacity=256, timed=False, contracts=False):
+        ## append only - the array doubles when it fills.
+        ## timed = intraday, add the InTime / ExTime bar times
+        ## contracts = options, add the CONTRACT_FIELDS
+        super().__init__()
+        self.timed = timed
+        self.contracts = contracts
+
+        fields = list(LEDGER_FIELDS)
+        if timed:
+            fields += [('InTime', 'datetime64[s]'), ('ExTime', 'datetime64[s]')]
+        if contracts:
+            fields += CONTRACT_FIELDS
+        self._rows = numpy.zeros(capacity, dtype=fields)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def append(self, trade):
+        if self.n == len(self._rows):
+            grown = numpy.zeros(2 * len(self._rows), dtype=self._rows.dtype)
+            grown[:self.n] = self._rows
+            self._rows = grown
+
+        row = (trade.InDate, trade.ExDate, trade.Position, trade.Duration,
+               self.code(trade.InSignal), trade.Entry, self.code(trade.ExSignal),
+               trade.Exit, trade.DollarBase, trade.Value, trade.TradeRtn, trade.PNL)
+        if self.timed:
+            row += (trade.InTime, trade.ExTime)
+        if self.contracts:
+            if trade.Contract is None:
+                row += (NO_DATE, numpy.nan, 0)
+            else:
+                expiry, strike, right = trade.Contract
+                row += (expiry, strike, self.code(right))
+        self._rows[self.n] = row
+        self.n += 1
+
+    def array(self):
+        return self._rows[:self.n]
+
+    def column(self, name):
+        return self._rows[name][:self.n]
+
+    def frame(self):
+        return self._frame(self.array())
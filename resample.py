@@ -0,0 +1,159 @@
+from enum import Enum
+import numpy
+import pandas
+from security import Bar, BarData
+
+
+class Period(str, Enum):
+    DAY = 'D'
+    WEEK = 'W'          ## monday - sunday weeks
+    MONTH = 'M'
+    QUARTER = 'Q'
+    YEAR = 'Y'
+
+
+"""
+multi-timeframe bars
+
+a Security is resampled once, vectorized, into a higher timeframe: a
+calendar Period or an intraday interval ('30min', '4h' ...). every
+higher timeframe bar is an ordinary BarData row, and rows[i] is the
+latest one that closed before base bar i - so the strategy's weekly
+bar is an array lookup per step, no per-bar bookkeeping.
+
+a period is only known to be over once the first bar of the next one
+arrives (a thursday before a holiday friday ends its week), so on
+every bar of a week - the last one included - rows[i] points at the
+week before. nothing the hooks see at bar i depends on bar i or later.
+before the first period closes rows[i] is -1.
+
+resampled bars are labelled with the Date / Timestamp of their first
+base bar.
+"""
+
+
+def period_keys(data, timeframe):
+    ## group key per base row - equal keys share a higher timeframe bar
+    if timeframe in Period._value2member_map_:
+        period = Period(timeframe)
+        if period == Period.DAY:
+            return data.ordinals.astype(numpy.int64)
+        if period == Period.WEEK:
+            ## 1970-01-01 was a thursday, so +3 starts the weeks on monday
+            return (data.ordinals.astype(numpy.int64) + 3) // 7
+        unit = dict(M='M', Q='M', Y='Y')[period.value]
+        keys = data.dates.astype(f'datetime64[{unit}]').view(numpy.int64)
+        return keys // 3 if period == Period.QUARTER else keys
+
+    ## intraday interval
+    assert(data.intraday)
+    seconds = int(pandas.Timedelta(timeframe).total_seconds())
+    assert(seconds > 0)
+    return data.stamps.view(numpy.int64) // seconds
+
+
+def _first(values, starts, ends):
+    return values[starts]
+
+
+def _last(values, starts, ends):
+    return values[ends - 1]
+
+
+def _high(values, starts, ends):
+    return numpy.maximum.reduceat(values, starts)
+
+
+def _low(values, starts, ends):
+    return numpy.minimum.reduceat(values, starts)
+
+
+def _total(values, starts, ends):
+    return numpy.add.reduceat(values, starts)
+
+
+def _splits(values, starts, ends):
+    ## combined split ratio in the period, 0 = no split (file convention)
+    ratio = numpy.multiply.reduceat(numpy.where(values > 0, values, 1.0), starts)
+    return numpy.where(ratio == 1.0, 0.0, ratio)
+
+
+## how each column reduces over a period - anything not listed takes the last value
+REDUCERS = {
+    'Date': _first, 'Timestamp': _first,
+    'Open': _first, 'Adj Open': _first,
+    'High': _high, 'Adj High': _high,
+    'Low': _low, 'Adj Low': _low,
+    'Volume': _total, 'Dividends': _total,
+    'Stock Splits': _splits,
+}
+
+
+def resample_columns(columns, keys):
+    ## keys must be non-decreasing (they are - bars are in date order)
+    if len(keys) == 0:
+        return { col: values[:0] for col, values in columns.items() }
+
+    starts = numpy.concatenate([[0], numpy.flatnonzero(keys[1:] != keys[:-1]) + 1])
+    ends = numpy.append(starts[1:], len(keys))
+
+    out = dict()
+    for col, values in columns.items():
+        out[col] = REDUCERS.get(col, _last)(values, starts, ends)
+
+    if 'VWAP' in columns:
+        ## volume weighted across the period's bars
+        v = _total(columns['Volume'], starts, ends)
+        pv = _total(columns['VWAP'] * columns['Volume'], starts, ends)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            out['VWAP'] = numpy.where(v > 0, pv / v, out['Close'])
+    return out
+
+
+def resample(data, timeframe):
+    ## (higher timeframe BarData, rows) for a base BarData - built once
+    ## per timeframe and kept on the base data
+    hit = data._resampled.get(timeframe)
+    if hit is None:
+        keys = period_keys(data, timeframe)
+        ## adjusted prices reduce bar by bar, like the raw ones
+        columns = dict(data.columns, **data.adjusted_columns())
+        htf = BarData(resample_columns(columns, keys))
+
+        n = len(keys)
+        group = numpy.cumsum(numpy.concatenate([[0], keys[1:] != keys[:-1]])) if n else numpy.zeros(0, dtype=numpy.int64)
+        ## the period before bar i's own - the last one closed when bar i opens
+        rows = (group - 1).astype(numpy.int64)
+
+        hit = data._resampled[timeframe] = (htf, rows)
+    return hit
+
+
+class HigherTimeframe():
+    def __init__(self, security, timeframe):
+
+        """
+        higher timeframe view of a Security, index aligned with it:
+        bar(i) is the latest higher timeframe bar that closed before
+        base row i opened (None before the first one closes). prices
+        follow the base security's adjustment mode.
+        """
+
+        self.security = security
+        self.timeframe = timeframe
+        self.data, self.rows = resample(security._data, timeframe)
+
+    def __len__(self):
+        return len(self.data)
+
+    def bar(self, i):
+        k = self.rows[i]
+        if k < 0:
+            return None
+        return Bar(self.data.view(self.security.adjust_mode), k)
+
+    def bars_before(self, i, count):
+        ## the last count closed bars at base row i, oldest first
+        k = int(self.rows[i]) + 1
+        columns = self.data.view(self.security.adjust_mode)
+        return [ Bar(columns, j) for j in range(max(0, k - count), k) ]
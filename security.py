@@ -1,9 +1,33 @@
 from enum import Enum
+import numpy
 import pandas
-from datetime import datetime
+from datetime import date, datetime, timedelta
+import copy
+import hashlib
+import io
+import json
 import os
+import threading
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+try:
+    import fcntl
+except ImportError:
+    ## no flock on windows - cache writers are not serialized there
+    fcntl = None
 
 DATA_DIR = os.environ.get('DATA_DIR', '/home/jcarter/work/trading/data/')
+## parsed columns are cached here as memory-mappable .npy files.
+## set CACHE_DIR to an empty string to disable the cache
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(DATA_DIR, '.cache'))
+CACHE_VERSION = 4
+## compressed copies tried, in order, when DATA_DIR/<name>.csv is absent.
+## pandas picks the codec from the suffix (.zst needs the zstandard package)
+COMPRESSED_SUFFIXES = ['.gz', '.zst', '.xz', '.bz2']
+## intraday timestamps with utc offsets are converted to this exchange time zone
+INTRADAY_TZ = os.environ.get('INTRADAY_TZ', 'America/New_York')
+## data quality scan on load: OFF, WARN or STRICT - see quality.py
+VALIDATE_DATA = os.environ.get('VALIDATE_DATA', 'WARN')
 
 class SecType(str, Enum):
     STOCK = 'STOCK'
@@ -12,15 +36,797 @@ class SecType(str, Enum):
     OPTION = 'OPTION'
 
 
+class AdjustMode(str, Enum):
+    RAW = 'RAW'                     ## as traded - splits undone when the file has a Stock Splits column
+    SPLIT = 'SPLIT'                 ## split adjusted only - the file as is, yahoo style OHLC already is
+    TOTAL_RETURN = 'TOTAL_RETURN'   ## scaled by Adj Close / Close (splits + dividends)
+
+
+class Session(str, Enum):
+    ALL = 'ALL'     ## every bar in the file
+    RTH = 'RTH'     ## regular trading hours
+    ETH = 'ETH'     ## extended hours - pre market through post market
+
+
+## session windows in exchange local time: [open, close) on each bar's
+## timestamp (bars are labelled by their open). a window whose close is
+## before its open wraps midnight, e.g. ('18:00', '17:00') for globex
+SESSION_HOURS = { Session.RTH: ('09:30', '16:00'), Session.ETH: ('04:00', '20:00') }
+
+SECONDS_PER_DAY = 86400
+TRADING_DAYS_PER_YEAR = 252
+
+
+## price columns held by the bar store, all as contiguous float64 arrays
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+## corporate action columns kept when the file has them (yfinance style)
+ACTION_COLUMNS = ['Dividends', 'Stock Splits']
+## extra per-bar columns passed through to every bar view when present
+PASSTHROUGH_COLUMNS = ['Open Interest', 'Contract', 'Timestamp', 'VWAP']
+
+
+def _to_date(value):
+    ## normalize 'YYYY-MM-DD' strings, datetimes, datetime64 and day ordinals to datetime.date
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, (int, numpy.integer)):
+        return ordinal_to_date(value)
+    if isinstance(value, numpy.datetime64):
+        return ordinal_to_date(to_ordinal(value))
+    if _has_time(value):
+        return datetime.fromisoformat(value).date()
+    return date.fromisoformat(value)
+
+
+def _has_time(value):
+    ## datetimes and 'YYYY-MM-DD HH:MM[:SS]' strings pick a bar within the day
+    if isinstance(value, datetime):
+        return True
+    return isinstance(value, str) and len(value) > 10
+
+
+## dates travel through the engine as int32 day ordinals - days since
+## 1970-01-01, the datetime64[D] epoch. strings are only produced at
+## report/export time by format_dates
+EPOCH = date(1970, 1, 1)
+NO_DATE = int(numpy.iinfo(numpy.int32).min)
+
+
+def to_ordinal(value):
+    if isinstance(value, (int, numpy.integer)):
+        return int(value)
+    if isinstance(value, numpy.datetime64):
+        return int(value.astype('datetime64[D]').astype(numpy.int64))
+    return (_to_date(value) - EPOCH).days
+
+
+def date_ordinals(values):
+    ## datetime64[D] array -> int32 day ordinals
+    return values.astype('datetime64[D]').view(numpy.int64).astype(numpy.int32)
+
+
+def ordinal_to_date(value):
+    return EPOCH + timedelta(days=int(value))
+
+
+def format_dates(values):
+    ## day ordinals -> 'YYYY-MM-DD' strings ('' for NO_DATE)
+    ords = numpy.asarray(values, dtype=numpy.int64)
+    strs = numpy.datetime_as_string(ords.astype('datetime64[D]'), unit='D').astype(object)
+    strs[ords == NO_DATE] = ''
+    return strs
+
+
+def data_file(fn):
+    ## fn itself, or the first compressed copy of it that exists
+    if os.path.exists(fn):
+        return fn
+    for suffix in COMPRESSED_SUFFIXES:
+        if os.path.exists(fn + suffix):
+            return fn + suffix
+    return fn
+
+
+def symbol_file(symbol):
+    return data_file(f'{DATA_DIR}/{symbol}.csv')
+
+
+def is_compressed(fn):
+    return fn.endswith(tuple(COMPRESSED_SUFFIXES))
+
+
+def read_csv_columns(fn):
+    ## parse a price csv into Date (datetime64[D]) + float64 price columns
+    return frame_to_columns( pandas.read_csv(fn) )
+
+
+def parse_timestamps(values):
+    ## vectorized parse to naive datetime64[s] exchange time. offsets
+    ## (yfinance style '2023-01-03 09:30:00-05:00') are converted to INTRADAY_TZ
+    try:
+        stamps = pandas.to_datetime(values)
+    except (ValueError, TypeError):
+        ## mixed offsets across a dst change
+        stamps = pandas.to_datetime(values, utc=True)
+    if isinstance(stamps.dtype, pandas.DatetimeTZDtype):
+        stamps = stamps.dt.tz_convert(INTRADAY_TZ).dt.tz_localize(None)
+    return stamps.to_numpy(dtype='datetime64[s]')
+
+
+def _timestamp_source(df):
+    ## intraday files carry a Datetime column, a separate Time column
+    ## or a time in the Date column itself. daily files return None
+    if 'Datetime' in df.columns:
+        return df['Datetime']
+    if 'Time' in df.columns:
+        return df['Date'].astype(str) + ' ' + df['Time'].astype(str)
+    if len(df) > 0 and _has_time(str(df['Date'].iloc[0])):
+        return df['Date']
+    return None
+
+
+def frame_to_columns(df):
+    ## futures contract files carry no Adj Close
+    if 'Adj Close' not in df.columns:
+        df['Adj Close'] = df['Close']
+
+    source = _timestamp_source(df)
+    if source is None:
+        columns = dict(Date=df['Date'].to_numpy(dtype='datetime64[D]'))
+    else:
+        ## intraday: Date stays the trading day so every day based lookup
+        ## works unchanged, Timestamp carries the bar time
+        stamps = parse_timestamps(source)
+        columns = dict(Date=stamps.astype('datetime64[D]'), Timestamp=stamps)
+    for col in PRICE_COLUMNS:
+        columns[col] = numpy.ascontiguousarray(df[col].to_numpy(dtype=numpy.float64))
+    for col in ACTION_COLUMNS + ['Open Interest']:
+        if col in df.columns:
+            columns[col] = numpy.ascontiguousarray(df[col].fillna(0).to_numpy(dtype=numpy.float64))
+
+    ## Adj Open / High / Low are derived on first use - see BarData.adjusted_columns
+    return columns
+
+
+## binary column cache
+## CACHE_DIR/<key>/meta.json  - source fingerprint (size, mtime, sha1) + csv header
+## CACHE_DIR/<key>/<col>.npy  - one memory-mappable array per column
+##
+## when the source only grew (the daily append of one new row) the sha1
+## of the old prefix still matches, so just the new tail is parsed and
+## appended to the .npy files. any change to earlier rows rebuilds.
+## writers hold an exclusive flock on CACHE_DIR/<key>/.lock, and meta
+## records the row count so a torn or doubled append is never mapped.
+
+def _file_hash(fn):
+    h = hashlib.sha1()
+    with open(fn, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _cache_dir(key):
+    return os.path.join(CACHE_DIR, key)
+
+
+def _col_file(path, col):
+    return os.path.join(path, col.replace(' ', '_') + '.npy')
+
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_cache(fn, key):
+    path = _cache_dir(key)
+    meta = _read_meta(path)
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        return None
+
+    st = os.stat(fn)
+
+    ## a compressed file that grew is not the old bytes + new rows
+    if st.st_size > meta.get('size') and meta.get('header') and not is_compressed(fn):
+        return _append_tail(fn, path, meta)
+
+    if meta.get('size') != st.st_size:
+        return None
+
+    if meta.get('mtime_ns') != st.st_mtime_ns:
+        ## touched but maybe not changed - the content hash decides
+        if meta.get('sha1') != _file_hash(fn):
+            return None
+        meta['mtime_ns'] = st.st_mtime_ns
+        _write_meta(path, meta)
+
+    return _map_columns(path, meta)
+
+
+def _map_columns(path, meta):
+    try:
+        columns = { col: numpy.asarray(numpy.load(_col_file(path, col), mmap_mode='r')) for col in meta['columns'] }
+    except (OSError, ValueError):
+        return None
+    rows = meta.get('rows')
+    if rows is not None and any(len(values) != rows for values in columns.values()):
+        return None
+    return columns
+
+
+@contextmanager
+def _cache_lock(path):
+    ## exclusive across processes and threads - held while a cache dir is written
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, '.lock'), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _append_npy(fn, values):
+    ## append rows to a 1-d .npy file in place by rewriting its header shape.
+    ## returns False when the new header no longer fits the old padding
+    fmt = numpy.lib.format
+    with open(fn, 'r+b') as f:
+        version = fmt.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = fmt.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = fmt.read_array_header_2_0(f)
+        header_len = f.tell()
+        if dtype != values.dtype or len(shape) != 1:
+            return False
+
+        header = io.BytesIO()
+        d = dict(descr=fmt.dtype_to_descr(dtype), fortran_order=fortran, shape=(shape[0] + len(values),))
+        fmt.write_array_header_1_0(header, d) if version == (1, 0) else fmt.write_array_header_2_0(header, d)
+        if len(header.getvalue()) != header_len:
+            return False
+
+        f.seek(0, os.SEEK_END)
+        f.write(numpy.ascontiguousarray(values).tobytes())
+        f.seek(0)
+        f.write(header.getvalue())
+    return True
+
+
+def _append_tail(fn, path, meta):
+    try:
+        with _cache_lock(path):
+            ## another loader may have appended since meta was read
+            current = _read_meta(path)
+            if current is None or any(current.get(k) != meta.get(k) for k in ['version', 'size', 'sha1']):
+                st = os.stat(fn)
+                if current is not None and current.get('version') == CACHE_VERSION \
+                        and current.get('size') == st.st_size and current.get('mtime_ns') == st.st_mtime_ns:
+                    return _map_columns(path, current)
+                return None
+            return _append_locked(fn, path, current)
+    except OSError:
+        return None
+
+
+def _append_locked(fn, path, meta):
+    ## the old prefix must hash to the stored sha1 and end on a full line
+    h = hashlib.sha1()
+    with open(fn, 'rb') as f:
+        remaining = meta['size']
+        last = b''
+        while remaining > 0:
+            chunk = f.read(min(1 << 20, remaining))
+            if not chunk:
+                return None
+            h.update(chunk)
+            remaining -= len(chunk)
+            last = chunk[-1:]
+        if h.hexdigest() != meta['sha1'] or last != b'\n':
+            return None
+        tail = f.read()
+    h.update(tail)
+
+    new = frame_to_columns( pandas.read_csv(io.BytesIO(tail), header=None, names=meta['header']) )
+    if list(new.keys()) != meta['columns']:
+        return None
+
+    try:
+        ## drop meta first - an interrupted append then rebuilds from scratch
+        os.remove(os.path.join(path, 'meta.json'))
+        for col in meta['columns']:
+            col_fn = _col_file(path, col)
+            if not _append_npy(col_fn, new[col]):
+                values = numpy.concatenate([ numpy.load(col_fn), new[col] ])
+                tmp = os.path.join(path, f'tmp.{_tmp_suffix()}.npy')
+                numpy.save(tmp, values)
+                os.replace(tmp, col_fn)
+
+        meta.update(size=meta['size'] + len(tail),
+                    mtime_ns=os.stat(fn).st_mtime_ns,
+                    sha1=h.hexdigest())
+        if meta.get('rows') is not None:
+            meta['rows'] += len(new['Date'])
+        _write_meta(path, meta)
+    except OSError:
+        return None
+
+    return _map_columns(path, meta)
+
+
+def _tmp_suffix():
+    ## unique per process and thread - the universe loader writes in parallel
+    return f'{os.getpid()}.{threading.get_ident()}'
+
+
+def _write_meta(path, meta):
+    tmp = os.path.join(path, f'meta.json.{_tmp_suffix()}')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(path, 'meta.json'))
+
+
+def _write_columns(path, columns, meta):
+    try:
+        with _cache_lock(path):
+            ## meta goes last - a cache without meta.json is never read
+            meta_fn = os.path.join(path, 'meta.json')
+            if os.path.exists(meta_fn):
+                os.remove(meta_fn)
+
+            for col, values in columns.items():
+                tmp = os.path.join(path, f'tmp.{_tmp_suffix()}.npy')
+                numpy.save(tmp, values)
+                os.replace(tmp, _col_file(path, col))
+
+            rows = len(next(iter(columns.values()))) if columns else 0
+            meta.update(version=CACHE_VERSION, columns=list(columns.keys()), rows=rows)
+            _write_meta(path, meta)
+    except OSError:
+        ## caching is best effort - a read-only DATA_DIR still loads
+        pass
+
+
+def _write_cache(fn, key, columns):
+    st = os.stat(fn)
+    meta = dict(source=os.path.abspath(fn),
+                size=st.st_size,
+                mtime_ns=st.st_mtime_ns,
+                sha1=_file_hash(fn),
+                header=pandas.read_csv(fn, nrows=0).columns.tolist())
+    _write_columns(_cache_dir(key), columns, meta)
+
+
+def load_built_columns(key, sources, build):
+    ## cache for columns derived from several source files (a continuous
+    ## futures series, an option chain ...). build() is only called when
+    ## a source was added, removed, resized or touched
+    if not CACHE_DIR:
+        return build()
+
+    fingerprint = dict()
+    for fn in sources:
+        st = os.stat(fn)
+        fingerprint[os.path.abspath(fn)] = [st.st_size, st.st_mtime_ns]
+
+    path = _cache_dir(key)
+    meta = _read_meta(path)
+    if meta is not None and meta.get('version') == CACHE_VERSION and meta.get('sources') == fingerprint:
+        columns = _map_columns(path, meta)
+        if columns is not None:
+            return columns
+
+    columns = build()
+    _write_columns(path, columns, dict(sources=fingerprint))
+    return columns
+
+
+def window_columns(columns, start_dt=None, end_dt=None, warmup_bars=0):
+    ## slice every column to [start_dt - warmup_bars, end_dt]. on memory-mapped
+    ## cache columns the date search touches O(log n) pages and only the rows
+    ## in the window are ever read from disk
+    dates = columns['Date']
+    lo = 0
+    hi = len(dates)
+    if start_dt is not None:
+        lo = int(numpy.searchsorted(dates, numpy.datetime64(_to_date(start_dt), 'D'), side='left'))
+        lo = max(0, lo - warmup_bars)
+    if end_dt is not None:
+        hi = int(numpy.searchsorted(dates, numpy.datetime64(_to_date(end_dt), 'D'), side='right'))
+    hi = max(lo, hi)
+    return { col: values[lo:hi] for col, values in columns.items() }
+
+
+def _session_hours(session):
+    ## Session / name / (open, close) pair -> (open, close) seconds of day.
+    ## None means no filtering
+    if session is None:
+        return None
+    if isinstance(session, str):
+        session = Session(session)
+        if session == Session.ALL:
+            return None
+        session = SESSION_HOURS[session]
+
+    def _seconds(hhmm):
+        parts = [ int(p) for p in hhmm.split(':') ] + [0]
+        return parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+    open_time, close_time = session
+    return _seconds(open_time), _seconds(close_time)
+
+
+def session_mask(stamps, session):
+    ## True for bars whose timestamp falls inside the session
+    hours = _session_hours(session)
+    if hours is None:
+        return numpy.ones(len(stamps), dtype=bool)
+
+    open_sec, close_sec = hours
+    tod = stamps.astype('datetime64[s]').view(numpy.int64) % SECONDS_PER_DAY
+    if open_sec <= close_sec:
+        return (tod >= open_sec) & (tod < close_sec)
+    return (tod >= open_sec) | (tod < close_sec)
+
+
+def session_columns(columns, session):
+    ## drop intraday bars outside the session. daily data passes through
+    stamps = columns.get('Timestamp')
+    if stamps is None or _session_hours(session) is None:
+        return columns
+    mask = session_mask(stamps, session)
+    return { col: values[mask] for col, values in columns.items() }
+
+
+def load_columns(fn, key):
+    ## cached equivalent of read_csv_columns(fn)
+    if not CACHE_DIR:
+        return read_csv_columns(fn)
+
+    columns = _read_cache(fn, key)
+    if columns is None:
+        columns = read_csv_columns(fn)
+        _write_cache(fn, key, columns)
+    return columns
+
+
+class Bar():
+    ## lightweight read-only view of a single row in a column store.
+    ## supports the same bar['Close'] access the strategies use on a pandas row
+    __slots__ = ('_columns', '_i')
+
+    def __init__(self, columns, i):
+        self._columns = columns
+        self._i = i
+
+    def __getitem__(self, key):
+        return self._columns[key][self._i]
+
+    def __contains__(self, key):
+        return key in self._columns
+
+    @property
+    def index(self):
+        ## row of this bar in its column store
+        return self._i
+
+    def get(self, key, default=None):
+        column = self._columns.get(key)
+        if column is None:
+            return default
+        return column[self._i]
+
+    def keys(self):
+        return self._columns.keys()
+
+    def to_dict(self):
+        return { k: self[k] for k in self._columns.keys() }
+
+    def __repr__(self):
+        return f'Bar({self.to_dict()})'
+
+
+class BarData():
+    ## immutable bar arrays for one symbol. loaded once per process and
+    ## shared by every Security cursor on that symbol (see get_bar_data)
+    def __init__(self, columns):
+
+        ## ordinals is the int32 'Date' column handed out in every bar.
+        ## intraday data also has stamps - datetime64[s] bar times
+        self.columns = columns
+        self.dates = columns['Date']
+        self.ordinals = self.dates.view(numpy.int64).astype(numpy.int32)
+        self.stamps = columns.get('Timestamp')
+        self.intraday = self.stamps is not None
+
+        ## per AdjustMode column views, materialized on first use
+        self._views = dict()
+        self._adjusted = None
+        ## timeframe -> higher timeframe data, see resample.py
+        self._resampled = dict()
+        ## (file, size, mtime_ns) of the csv the bars came from - None for
+        ## built or published data, which is never re-checked
+        self.source = None
+
+        ## day ordinal -> first row of that day, so lookups are O(1).
+        ## one entry per day - not per bar - on intraday data
+        days, first = numpy.unique(self.ordinals, return_index=True)
+        self.date_index = dict(zip(days.tolist(), first.tolist()))
+
+        ## bars in a typical day - 1 on daily data
+        self.bars_per_day = 1
+        if self.intraday and len(first) > 0:
+            counts = numpy.diff(numpy.append(first, len(self.ordinals)))
+            self.bars_per_day = int(numpy.median(counts))
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def dt_at(self, index):
+        ## the cur_dt handed to the hooks: datetime.date, or
+        ## datetime.datetime on intraday data - built per bar
+        return (self.stamps if self.intraday else self.dates)[index].item()
+
+    def periods_per_year(self):
+        ## annualization factor for per-bar returns
+        return TRADING_DAYS_PER_YEAR * self.bars_per_day
+
+    def search(self, dt, side='left'):
+        ## row index of dt in bar order (numpy.searchsorted semantics).
+        ## a datetime - or 'YYYY-MM-DD HH:MM' string - resolves to the bar
+        ## time on intraday data, anything else to the whole day
+        if self.intraday and _has_time(dt):
+            key = numpy.datetime64(datetime.fromisoformat(dt) if isinstance(dt, str) else dt, 's')
+            return int(numpy.searchsorted(self.stamps, key, side=side))
+        return int(numpy.searchsorted(self.ordinals, to_ordinal(dt), side=side))
+
+    def view(self, mode=AdjustMode.TOTAL_RETURN):
+        ## column dict handed to Bar for the given adjustment mode
+        v = self._views.get(mode)
+        if v is None:
+            v = self._views[mode] = self._materialize(mode)
+        return v
+
+    def _materialize(self, mode):
+        view = self._price_view(mode)
+        for col in PASSTHROUGH_COLUMNS:
+            if col in self.columns:
+                view[col] = self.columns[col]
+        return view
+
+    def adjusted_columns(self):
+        ## Adj Open / High / Low. futures and tick bars store their own,
+        ## csv bars scale the raw prices by Adj Close / Close - built once
+        c = self.columns
+        if 'Adj Open' in c:
+            return { col: c[col] for col in ['Adj Open', 'Adj High', 'Adj Low'] }
+
+        if self._adjusted is None:
+            r = c['Adj Close'] / c['Close']
+            self._adjusted = { f'Adj {col}': c[col] * r for col in ['Open', 'High', 'Low'] }
+        return self._adjusted
+
+    def _price_view(self, mode):
+        c = self.columns
+
+        if mode == AdjustMode.TOTAL_RETURN:
+            adjusted = self.adjusted_columns()
+            return dict(Date=self.ordinals,
+                        Open=adjusted['Adj Open'],
+                        High=adjusted['Adj High'],
+                        Low=adjusted['Adj Low'],
+                        Close=c['Adj Close'],
+                        Volume=c['Volume'])
+
+        ## yahoo style files - the ones with a Stock Splits column - carry
+        ## split adjusted prices, so the file as is is the SPLIT view
+        view = dict(Date=self.ordinals)
+        for col in PRICE_COLUMNS:
+            view[col] = c[col]
+        if mode == AdjustMode.SPLIT or 'Stock Splits' not in c:
+            return view
+
+        ## RAW undoes the splits: the factor in effect after each bar is the
+        ## product of all later split ratios. prices are multiplied and
+        ## volume divided by it
+        splits = numpy.where(c['Stock Splits'] > 0, c['Stock Splits'], 1.0)
+        later = numpy.cumprod(splits[::-1])[::-1]
+        factor = numpy.append(later[1:], 1.0)
+        for col in ['Open', 'High', 'Low', 'Close', 'Adj Close']:
+            view[col] = c[col] * factor
+        view['Volume'] = c['Volume'] / factor
+        return view
+
+
+## process-wide registry: symbol (or symbol + date window) -> BarData
+_REGISTRY = dict()
+
+
+def source_fingerprint(symbol):
+    ## (file, size, mtime_ns) of DATA_DIR/<symbol>.csv[.gz ...]
+    fn = symbol_file(symbol)
+    st = os.stat(fn)
+    return fn, st.st_size, st.st_mtime_ns
+
+
+def symbol_columns(symbol, reload=False):
+    ## the full columns of DATA_DIR/<symbol>.csv[.gz ...], loaded once per
+    ## file version - the quality scan and every date window share them
+    fingerprint = source_fingerprint(symbol)
+
+    key = (symbol, 'columns')
+    hit = _REGISTRY.get(key)
+    if hit is not None and hit[0] == fingerprint and not reload:
+        return hit[1]
+
+    columns = load_columns(fingerprint[0], symbol)
+    _REGISTRY[key] = (fingerprint, columns)
+    return columns
+
+
+def bar_data_key(symbol, start_dt=None, end_dt=None, warmup_bars=0, session=None):
+    ## registry key of get_bar_data: the symbol, or symbol + date window
+    ## (+ session hours)
+    hours = _session_hours(session)
+    if start_dt is None and end_dt is None and hours is None:
+        return symbol
+    key = (symbol, str(start_dt), str(end_dt), warmup_bars)
+    if hours is not None:
+        key += (hours,)
+    return key
+
+
+def get_bar_data(symbol, start_dt=None, end_dt=None, warmup_bars=0, reload=False, session=None):
+    ## session (intraday only): Session, its name or an (open, close) pair
+    key = bar_data_key(symbol, start_dt, end_dt, warmup_bars, session)
+    windowed = start_dt is not None or end_dt is not None
+
+    data = _REGISTRY.get(key)
+    fingerprint = source_fingerprint(symbol)
+    ## a hit is only good while the file is unchanged - the after close
+    ## rerun of a long lived process must see the new bars
+    stale = data is not None and data.source is not None and data.source != fingerprint
+    if data is None or reload or stale:
+        columns = symbol_columns(symbol, reload)
+        ## filter first so warmup_bars counts session bars
+        columns = session_columns(columns, session)
+        if windowed:
+            columns = window_columns(columns, start_dt, end_dt, warmup_bars)
+        data = BarData(columns)
+        data.source = fingerprint
+        _REGISTRY[key] = data
+    return data
+
+
+def clear_registry():
+    _REGISTRY.clear()
+
+
+## shared memory publishing for multiprocess sweeps.
+## the parent publishes a symbol's columns once, workers attach by name:
+##
+##   shared = SharedBars.publish('SPY')
+##   pool = multiprocessing.Pool(64, initializer=attach_shared, initargs=(shared.spec,))
+##   ...
+##   shared.unlink()
+##
+## after attach_shared the worker's Security('SPY') reads the parent's
+## pages directly - zero-copy and read-only. (workers that only load from
+## the binary cache already share pages through the OS page cache.)
+
+_SHM_ALIGN = 64
+
+
+class SharedBars():
+    def __init__(self, shm, spec):
+        self.shm = shm
+        self.spec = spec
+
+    @classmethod
+    def publish(cls, symbol, start_dt=None, end_dt=None, warmup_bars=0, session=None):
+        ## workers must load with the same window (and session) to attach
+        columns = get_bar_data(symbol, start_dt, end_dt, warmup_bars, session=session).columns
+
+        layout = []
+        offset = 0
+        for col, values in columns.items():
+            layout.append(dict(col=col, dtype=values.dtype.str, shape=values.shape, offset=offset))
+            offset += -(-values.nbytes // _SHM_ALIGN) * _SHM_ALIGN
+
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for item in layout:
+            values = columns[item['col']]
+            dst = numpy.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf, offset=item['offset'])
+            dst[:] = values
+
+        ## spec is small and picklable - it is all a worker needs. the
+        ## quality report rides along so workers never re-read the file
+        spec = dict(symbol=symbol, key=bar_data_key(symbol, start_dt, end_dt, warmup_bars, session),
+                    name=shm.name, layout=layout)
+        if VALIDATE_DATA != 'OFF':
+            from quality import validate
+            validate(symbol, VALIDATE_DATA)
+            spec['quality'] = _REGISTRY.get((symbol, 'quality'))
+        return cls(shm, spec)
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        ## publisher only - release the segment once all workers are done
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unlink()
+
+
+def _open_shared(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        ## python < 3.13 has no track flag. multiprocessing workers share the
+        ## parent's resource tracker, so attaching never unlinks the segment
+        return shared_memory.SharedMemory(name=name)
+
+
+def attach_shared(spec):
+    ## worker side: map the published columns and register them so every
+    ## Security on spec['symbol'] - with the published window - uses them
+    shm = _open_shared(spec['name'])
+    columns = dict()
+    for item in spec['layout']:
+        values = numpy.ndarray(tuple(item['shape']), dtype=numpy.dtype(item['dtype']), buffer=shm.buf, offset=item['offset'])
+        values.flags.writeable = False
+        columns[item['col']] = values
+
+    data = BarData(columns)
+    ## keep the mapping alive as long as the data is
+    data._shm = shm
+    _REGISTRY[spec['key']] = data
+    if spec.get('quality') is not None:
+        _REGISTRY[(spec['symbol'], 'quality')] = spec['quality']
+    return data
+
+
 class Security():
-    def __init__(self, json_dict=None):
+    def __init__(self, json_dict=None, start_dt=None, end_dt=None, warmup_bars=0):
         self.symbol = None
         self.sec_type = None 
         self.margin_req = None
         self.tick_size = None
         self.tick_value = None
-        self._df = None
-        self._use_raw = False
+        ## FUTURE only: continuous series spec, see futures.py
+        self.continuous = None
+        ## bars aggregated from a tick file, see ticks.py
+        self.ticks = None
+        ## OPTION only: symbol whose bars drive the cursor + lazily loaded chain, see options.py
+        self.underlying = None
+        self._chain = None
+        ## intraday only: Session (or an (open, close) pair) the bars are filtered to
+        self.session = None
+        self._adjust = AdjustMode.TOTAL_RETURN
+        self._columns = None
+        ## data quality report of the csv behind the bars (quality.py)
+        self.quality = None
+
+        ## shared columnar bar store - this object is only a cursor over it
+        self._data = None
+        ## cursor state: next row to hand out and the [start, end) slice
+        self._pos = 0
+        self._start = 0
+        self._end = 0
 
         if json_dict:
             self.symbol = json_dict.get('symbol')
@@ -30,61 +836,190 @@ class Security():
                 margin_req = json_dict.get('margin_req')
                 assert(margin_req > 0)
                 self.margin_req = margin_req
+                self.continuous = json_dict.get('continuous')
+            if self.sec_type == SecType.OPTION:
+                self.underlying = json_dict.get('underlying', self.symbol)
             tick_size = json_dict.get('tick_size')
             assert(tick_size > 0)
             tick_value = json_dict.get('tick_value')
             assert(tick_value > 0)
             self.tick_size = tick_size
             self.tick_value = tick_value
+            self.session = json_dict.get('session')
+            self.ticks = json_dict.get('ticks')
 
-        self.load_data()
-        self._bar_generator = self._create_bar_generator()
+        self.load_data(start_dt, end_dt, warmup_bars)
 
     ## defaults to false in initialization 
     def use_raw(self, v=True):
-        self._use_raw = v 
-   
-    def load_data(self):
-        fn = f'{DATA_DIR}/{self.symbol}.csv'
-        self._df = pandas.read_csv(fn)
+        self.set_adjust(AdjustMode.RAW if v else AdjustMode.TOTAL_RETURN)
 
-    def _adjust_prices(self, df_row):
-        ## adjust the entire price df_row to adjusted prices
-        ## using the ratio of of Adj_Close/Close as multiplier
-        r = df_row['Adj Close']/df_row['Close']
-        ah = df_row['High'] * r
-        al = df_row['Low'] * r
-        ao = df_row['Open'] * r
-        dd = dict(Date=df_row['Date'], Open=ao, High=ah, Low=al, Close=df_row['Adj Close'], Volume=df_row['Volume'])
-        return pandas.Series(dd)
+    def set_adjust(self, mode):
+        ## switch price adjustment - takes effect on the very next bar
+        self._adjust = AdjustMode(mode)
+        self._columns = self._data.view(self._adjust)
 
+    @property
+    def adjust_mode(self):
+        return self._adjust
+   
+    @classmethod
+    def get(cls, json_dict, start_dt=None, end_dt=None, warmup_bars=0):
+        ## cursor on the shared, already loaded bar data for json_dict['symbol']
+        return cls(json_dict, start_dt, end_dt, warmup_bars)
 
-    def _create_bar_generator(self):
+    def cursor(self):
+        ## new cursor on the same data with its own position and raw setting
+        c = copy.copy(self)
+        c.reset()
+        return c
 
-        for index, row in self._df.iterrows():
-            if self._use_raw == False:
-                row = self._adjust_prices(row)
-            dt_index = row['Date']
-            cur_dt = datetime.strptime(dt_index,"%Y-%m-%d").date()
+    def load_data(self, start_dt=None, end_dt=None, warmup_bars=0, reload=False):
+        ## optional date window - only [start_dt - warmup_bars, end_dt] is loaded
+        if self.continuous:
+            ## stitched from per-contract files
+            from futures import get_continuous_data
+            self._data = get_continuous_data(self.symbol, self.continuous, start_dt, end_dt, warmup_bars, reload=reload)
+        elif self.ticks:
+            ## time / volume / tick bars built from prints
+            from ticks import get_tick_bar_data
+            self._data = get_tick_bar_data(self.symbol, self.ticks, start_dt, end_dt, warmup_bars, reload=reload, session=self.session)
+        else:
+            symbol = self.underlying or self.symbol
+            if VALIDATE_DATA != 'OFF':
+                ## cached per file fingerprint - free after the first scan
+                from quality import validate
+                self.quality = validate(symbol, VALIDATE_DATA)
+            self._data = get_bar_data(symbol, start_dt, end_dt, warmup_bars, reload=reload, session=self.session)
+        self._columns = self._data.view(self._adjust)
+        self._start = self._pos = 0
+        self._end = len(self._data)
 
-            yield index, cur_dt, row 
+    ## cursor api
 
     def next_bar(self):
-        return next(self._bar_generator)
+        index = self._pos
+        if index >= self._end:
+            raise StopIteration
+        self._pos = index + 1
+        return self._bar_at(index)
+
+    def __iter__(self):
+        ## iterate (index, cur_dt, bar) from the current position to the end of the slice
+        while self._pos < self._end:
+            yield self.next_bar()
+
+    def reset(self):
+        ## rewind to the start of the current slice
+        self._pos = self._start
+
+    def set_range(self, start_dt=None, end_dt=None):
+        ## restrict the cursor to bars between start_dt and end_dt inclusive
+        self._start, self._end = self.index_range(start_dt, end_dt)
+        self._pos = self._start
+
+    def seek(self, dt, warmup_bars=0):
+        ## position on the first bar on or after dt, backed up by
+        ## warmup_bars so indicators are primed when dt is reached
+        index = self._data.search(dt)
+        self._pos = max(self._start, index - warmup_bars)
+
+    def remaining_range(self):
+        ## (first, end) rows next_bar() has yet to hand out
+        return self._pos, self._end
+
+    def remaining_columns(self):
+        ## those rows as zero-copy column slices, in the adjustment mode
+        lo, hi = self.remaining_range()
+        return { col: values[lo:hi] for col, values in self._columns.items() }
+
+    def periods_per_year(self):
+        ## bars per year - 252 on daily data
+        return self._data.periods_per_year()
+
+    @property
+    def intraday(self):
+        return self._data.intraday
+
+    def current_index(self):
+        ## row of the last bar handed out by next_bar()
+        return max(self._pos - 1, self._start)
+
+    def current_date(self):
+        ## day ordinal of the last bar handed out by next_bar()
+        return int(self._data.ordinals[self.current_index()])
+
+    def bar_time(self, index):
+        ## datetime64 bar time of row index, None on daily data
+        if not self._data.intraday:
+            return None
+        return self._data.stamps[index]
+
+    ## option chain access (SecType.OPTION)
+
+    def option_chain(self):
+        if self._chain is None:
+            from options import get_option_chain
+            self._chain = get_option_chain(self.symbol)
+        return self._chain
+
+    def chain(self, dt=None):
+        ## today's chain (or dt's) as zero-copy column views
+        if dt is None:
+            dt = self.current_date()
+        return self.option_chain().chain(dt)
+
+    def nearest_option(self, strike, min_expiry=None, right='C', dt=None):
+        ## quote of the strike nearest to strike in the first expiry >= min_expiry
+        if dt is None:
+            dt = self.current_date()
+        chain = self.option_chain()
+        index = chain.nearest(dt, strike, min_expiry, right)
+        if index is None:
+            return None
+        return chain.quote(index)
+
+    def bars(self, start_dt=None, end_dt=None):
+        ## (index, cur_dt, bar) over a slice without moving the cursor
+        lo, hi = self.index_range(start_dt, end_dt)
+        for index in range(lo, hi):
+            yield self._bar_at(index)
+
+    def _bar_at(self, index):
+        return index, self._data.dt_at(index), Bar(self._columns, index)
 
     def fetch_bar(self, str_date):
-        filtered_df = self._df[self._df['Date'] == str_date]
-        if filtered_df.empty:
+        ## exact date lookup - accepts 'YYYY-MM-DD', a date or a day ordinal
+        index = self._data.date_index.get(to_ordinal(str_date))
+        if index is None:
+            return None
+
+        return self._bar_at(index)
+
+    def fetch_bar_before(self, dt, inclusive=True):
+        ## nearest bar on or before dt (strictly before if inclusive=False)
+        if inclusive:
+            index = self._data.search(dt, side='right') - 1
+        else:
+            index = self._data.search(dt) - 1
+        if index < 0:
             return None
-        ## grab the first row in the filtered series
-        index = filtered_df.index[0]
-        row = filtered_df.loc[index]
-        if self._use_raw == False:
-            row = self._adjust_prices(row)
-        dt_index = row['Date']
-        cur_dt = datetime.strptime(dt_index,"%Y-%m-%d").date()
-
-        return index, cur_dt, row 
+
+        return self._bar_at(index)
+
+    def index_range(self, start_dt=None, end_dt=None):
+        ## [lo, hi) row indices of the bars between start_dt and end_dt inclusive
+        lo = 0
+        hi = len(self._data)
+        if start_dt is not None:
+            lo = self._data.search(start_dt)
+        if end_dt is not None:
+            hi = self._data.search(end_dt, side='right')
+        return lo, max(lo, hi)
+
+    def fetch_range(self, start_dt=None, end_dt=None):
+        lo, hi = self.index_range(start_dt, end_dt)
+        return [ self._bar_at(index) for index in range(lo, hi) ]
             
 
 
@@ -108,22 +1043,15 @@ if __name__ == '__main__':
 
     spy = Security(etf_def)
 
-    """
-    ## NOTE: you can't use generators in a for loop
-    i = 0
-    while i < 3:
-        i, dtt, row  = spy.next_bar()
-        print(i, dtt, row)
-    """
-
-    while True:
-        try:
-            i, dtt, row = spy.next_bar()
-        except StopIteration:
-            break
+    for i, dtt, row in spy:
+        pass
     ## print the last row
     print(i, dtt, row)
 
+    ## rewind and replay 2008 with a 50 bar warm-up
+    spy.seek("2008-01-02", warmup_bars=50)
+    print(spy.next_bar())
+
 
 
     v = spy.fetch_bar("2008-10-14")
@@ -0,0 +1,176 @@
+import math
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+"""
+array helpers for the vectorized engine (BackTest.run_vectorized)
+
+a strategy declares its entry as one boolean array over the bar history -
+True on the bars it would enter at the Open - written with the helpers
+below so it only looks at earlier bars:
+
+    def entry_signal(self, columns):
+        close = columns['Close']
+        rtn = shift(close, 1) / shift(close, 2) - 1
+        return rtn <= self.threshold
+
+exits are the PNL / EXPIRY / STOP_OUT family the strategies share, checked
+at the Close in this order:
+
+    PNL       Close > Entry
+    EXPIRY    Duration > settings['duration']
+    STOP_OUT  Close <= StopLevel
+
+with StopLevel the BackTest.calc_price_stop trailing stop: the highest
+price since entry less STOP_MULTIPLIER rolling stdevs of the Close
+(settings['StDev'] bars), or STOP_DEFAULT below it before the stdev
+window fills. the stop only ratchets up.
+"""
+
+## BackTest.calc_price_stop defaults
+STOP_MULTIPLIER = 2.5
+STOP_DEFAULT = 0.30
+
+
+def shift(values, n=1, fill=numpy.nan):
+    ## values[i - n] at row i - n bars back, fill where there is none
+    values = numpy.asarray(values, dtype=numpy.float64)
+    out = numpy.full(len(values), fill, dtype=numpy.float64)
+    if n < len(values):
+        out[n:] = values[:len(values) - n]
+    return out
+
+
+def rolling_mean(values, window):
+    ## mean of the window bars ending at each row, NaN until it fills
+    values = numpy.asarray(values, dtype=numpy.float64)
+    out = numpy.full(len(values), numpy.nan)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window).mean(axis=1)
+    return out
+
+
+## y ** 2 the way python computes it (libm pow) - numpy squares with x * x,
+## which differs from pow in the last bit now and then
+_square = numpy.frompyfunc(math.pow, 2, 1)
+
+
+def rolling_stdev(values, window):
+    ## sample stdev of the window bars ending at each row, NaN until it fills.
+    ## two passes summed oldest to newest - the StDev indicator's order, so
+    ## stops match run() to the last bit
+    values = numpy.asarray(values, dtype=numpy.float64)
+    out = numpy.full(len(values), numpy.nan)
+    if len(values) >= window:
+        windows = sliding_window_view(values, window)
+        total = numpy.zeros(len(windows))
+        for k in range(window):
+            total += windows[:, k]
+        mean = total / window
+        total[:] = 0.0
+        for k in range(window):
+            total += _square(windows[:, k] - mean, 2.0).astype(numpy.float64)
+        out[window - 1:] = numpy.sqrt(total / (window - 1))
+    return out
+
+
+def price_stop(anchor, vol, multiplier=STOP_MULTIPLIER, default=STOP_DEFAULT):
+    ## calc_price_stop for a long, elementwise - NaN vol = not enough bars yet
+    return numpy.where(numpy.isnan(vol), anchor * (1 - default), anchor - (vol * multiplier))
+
+
+## exit codes returned by first_passage, index = code
+EXIT_LABELS = ['PNL', 'EXPIRY', 'STOP_OUT']
+
+## bars checked in the first stage of first_passage - most trades are
+## resolved there, the rest move on to stages four times wider
+FIRST_STAGE = 8
+
+
+def _padded(values, horizon):
+    ## values with horizon NaNs appended so any window fits
+    return numpy.concatenate([values, numpy.full(horizon, numpy.nan)])
+
+
+def first_passage(entries, entry_prices, open_, high, close, vol, duration,
+                  multiplier=STOP_MULTIPLIER, default=STOP_DEFAULT):
+
+    """
+    exit bar of every candidate long trade at once. entries[t] is the bar
+    whose Open trade t enters at entry_prices[t]; vol[k] is the stdev of
+    the closes up to and including bar k.
+
+    each trade lives at most duration + 1 bars (EXPIRY). the horizon is
+    walked in stages of widening column blocks over all unresolved trades
+    at once: a running max of the highs gives the trailing stop, the
+    first column where PNL, EXPIRY or STOP_OUT fires is the exit, and the
+    trades that exit drop out before the next stage.
+
+    returns (exits, codes):
+        exits[t]    exit bar, -1 if the data ends with the trade open
+        codes[t]    index into EXIT_LABELS, -1 if open
+    """
+
+    entries = numpy.asarray(entries, dtype=numpy.int64)
+    entry_prices = numpy.asarray(entry_prices, dtype=numpy.float64)
+    n = len(close)
+    horizon = duration + 1
+    high_p, close_p, vol_p = (_padded(values, horizon) for values in (high, close, vol))
+
+    exits = numpy.full(len(entries), -1, dtype=numpy.int64)
+    codes = numpy.full(len(entries), -1, dtype=numpy.int8)
+
+    ## per unresolved trade: highest price and StopLevel so far. the stop
+    ## is set at entry from the stdev up to the previous bar
+    active = numpy.arange(len(entries))
+    highest = open_[entries].astype(numpy.float64)
+    prev_vol = numpy.concatenate([[numpy.nan], vol])[entries]
+    stop = price_stop(highest, prev_vol, multiplier, default)
+
+    col, width = 0, FIRST_STAGE
+    while len(active) > 0 and col < horizon:
+        w = min(width, horizon - col)
+        e = entries[active]
+        days = col + numpy.arange(w)
+        idx = e[:, None] + days[None, :]
+
+        h = numpy.maximum.accumulate(numpy.fmax(high_p[idx], highest[:, None]), axis=1)
+        s = numpy.maximum.accumulate(numpy.maximum(price_stop(h, vol_p[idx], multiplier, default), stop[:, None]), axis=1)
+        checked = numpy.concatenate([stop[:, None], s[:, :-1]], axis=1)
+
+        c = close_p[idx]
+        pnl = (c - entry_prices[active][:, None]) > 0
+        expiry = (days + 1) > duration
+        stop_out = c <= checked
+        hit = (pnl | expiry[None, :] | stop_out) & (idx < n)
+
+        found = hit.any(axis=1)
+        k = numpy.argmax(hit, axis=1)
+        rows = numpy.flatnonzero(found)
+        k = k[rows]
+        done = active[rows]
+        exits[done] = e[rows] + col + k
+        codes[done] = numpy.where(pnl[rows, k], 0, numpy.where(expiry[k], 1, 2))
+
+        ## carry the rest into the next stage - trades past the end of the data stay open
+        keep = ~found & (e + col + w < n)
+        active, highest, stop = active[keep], h[keep, -1], s[keep, -1]
+        col += w
+        width *= 4
+
+    return exits, codes
+
+
+def trailing_stops(entries, open_, high, vol, horizon,
+                   multiplier=STOP_MULTIPLIER, default=STOP_DEFAULT):
+    ## StopLevel recorded on each of the first horizon bars of the trades
+    ## entered at entries - stops[t, d] is d bars after entry
+    entries = numpy.asarray(entries, dtype=numpy.int64)
+    idx = entries[:, None] + numpy.arange(horizon)[None, :]
+    high_p, vol_p = _padded(high, horizon), _padded(vol, horizon)
+
+    o = open_[entries][:, None]
+    stop0 = price_stop(o, numpy.concatenate([[numpy.nan], vol])[entries][:, None], multiplier, default)
+    h = numpy.maximum.accumulate(numpy.fmax(high_p[idx], o), axis=1)
+    return numpy.maximum.accumulate(numpy.maximum(price_stop(h, vol_p[idx], multiplier, default), stop0), axis=1)
@@ -0,0 +1,221 @@
+from enum import Enum
+import os
+import numpy
+import pandas
+import security
+from security import BarData, load_built_columns, data_file, window_columns, session_columns, parse_timestamps, _timestamp_source
+
+
+class BarType(str, Enum):
+    TIME = 'TIME'       ## a bar every size seconds (or '5min' style string)
+    VOLUME = 'VOLUME'   ## a bar every size shares / contracts traded
+    TICK = 'TICK'       ## a bar every size prints
+
+
+## tick rows are read this many at a time - memory stays bounded by
+## the chunk, not the file
+CHUNK_ROWS = 1_000_000
+
+
+"""
+streaming tick to bar aggregation
+
+    DATA_DIR/<symbol>_ticks.csv  - Timestamp,Price,Size
+                                   (Datetime or Date[+Time] also accepted,
+                                    Volume for Size)
+
+ticks are read in chunks and reduced to OHLCV + VWAP bars with numpy
+reduceat on each chunk. the bar still open at the end of a chunk is
+carried into the next one, so bars don't depend on the chunk size (up to
+float rounding in the VWAP sums).
+
+    TIME   bar k holds the prints stamped in [k*size, (k+1)*size) seconds
+           and is labelled with its open time
+    VOLUME bar k holds the prints that start inside cumulative volume
+           [k*size, (k+1)*size) - a print is never split across bars
+    TICK   bar k holds prints k*size .. (k+1)*size - 1
+
+symbol definition:
+    {
+        "symbol": "ES",
+        "sec_type": "FUTURE",
+        "tick_size": 0.25,
+        "tick_value": 12.50,
+        "margin_req": 12000,
+        "ticks": { "bar_type": "TIME", "size": "1min", "cache": true }
+    }
+"""
+
+
+BAR_FIELDS = ['Timestamp', 'Open', 'High', 'Low', 'Close', 'Volume', 'PV']
+
+
+def _bar_size(bar_type, size):
+    if bar_type == BarType.TIME and isinstance(size, str):
+        size = pandas.Timedelta(size).total_seconds()
+    assert(size > 0)
+    return int(size) if bar_type != BarType.VOLUME else float(size)
+
+
+class TickAggregator():
+    def __init__(self, bar_type=BarType.TIME, size=60):
+
+        """
+        incremental ticks -> bars. update() takes one chunk of
+        (datetime64 stamps, prices, sizes) and returns the bars it
+        completed. flush() returns the final partial bar.
+        """
+
+        self.bar_type = BarType(bar_type)
+        self.size = _bar_size(self.bar_type, size)
+
+        ## running volume / print count for VOLUME and TICK bar keys
+        self._volume = 0.0
+        self._count = 0
+        ## open bar carried between chunks: its key + one value per BAR_FIELDS
+        self._key = None
+        self._open = None
+
+    def _keys(self, stamps, sizes):
+        if self.bar_type == BarType.TIME:
+            return stamps.view(numpy.int64) // self.size
+        if self.bar_type == BarType.VOLUME:
+            start = self._volume + numpy.cumsum(sizes) - sizes
+            self._volume += float(sizes.sum())
+            return (start // self.size).astype(numpy.int64)
+        keys = (self._count + numpy.arange(len(stamps), dtype=numpy.int64)) // self.size
+        self._count += len(stamps)
+        return keys
+
+    def update(self, stamps, prices, sizes):
+        stamps = numpy.asarray(stamps, dtype='datetime64[s]')
+        prices = numpy.asarray(prices, dtype=numpy.float64)
+        sizes = numpy.asarray(sizes, dtype=numpy.float64)
+        if len(stamps) == 0:
+            return _empty_bars()
+
+        keys = self._keys(stamps, sizes)
+        starts = numpy.concatenate([[0], numpy.flatnonzero(keys[1:] != keys[:-1]) + 1])
+        ends = numpy.append(starts[1:], len(keys))
+
+        if self.bar_type == BarType.TIME:
+            ## label with the bar's open time, not its first print
+            opened = (keys[starts] * self.size).astype('datetime64[s]')
+        else:
+            opened = stamps[starts]
+
+        bars = [opened,
+                prices[starts],
+                numpy.maximum.reduceat(prices, starts),
+                numpy.minimum.reduceat(prices, starts),
+                prices[ends - 1],
+                numpy.add.reduceat(sizes, starts),
+                numpy.add.reduceat(prices * sizes, starts)]
+        bar_keys = keys[starts]
+
+        ## fold the bar carried from the last chunk into the first one
+        done = []
+        if self._open is not None:
+            if bar_keys[0] == self._key:
+                t, o, h, l, _, v, pv = self._open
+                bars[0][0] = t
+                bars[1][0] = o
+                bars[2][0] = max(h, bars[2][0])
+                bars[3][0] = min(l, bars[3][0])
+                bars[5][0] += v
+                bars[6][0] += pv
+            else:
+                done.append(self._open)
+
+        ## the last bar may continue in the next chunk
+        self._key = bar_keys[-1]
+        self._open = [ values[-1] for values in bars ]
+
+        completed = [ values[:-1] for values in bars ]
+        if done:
+            completed = [ numpy.concatenate([[carried], values]) for carried, values in zip(done[0], completed) ]
+        return _to_columns(completed)
+
+    def flush(self):
+        if self._open is None:
+            return _empty_bars()
+        last = [ numpy.array([value]) for value in self._open ]
+        self._open = None
+        self._key = None
+        return _to_columns(last)
+
+
+def _to_columns(fields):
+    ## BAR_FIELDS arrays -> the column layout BarData expects
+    stamps, o, h, l, c, v, pv = fields
+    stamps = numpy.asarray(stamps, dtype='datetime64[s]')
+    o, h, l, c, v, pv = (numpy.asarray(x, dtype=numpy.float64) for x in (o, h, l, c, v, pv))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        vwap = numpy.where(v > 0, pv / v, c)
+
+    ## tick built bars carry no corporate actions - the adjusted
+    ## columns are the raw ones
+    return dict(Date=stamps.astype('datetime64[D]'), Timestamp=stamps,
+                Open=o, High=h, Low=l, Close=c, Volume=v, VWAP=vwap,
+                **{ 'Adj Close': c, 'Adj Open': o, 'Adj High': h, 'Adj Low': l })
+
+
+def _empty_bars():
+    return _to_columns([ numpy.array([], dtype='datetime64[s]') ] + [ numpy.array([]) ] * 6)
+
+
+def tick_file(symbol, spec=None):
+    fn = (spec or {}).get('file')
+    if fn is None:
+        fn = f'{symbol}_ticks.csv'
+    return data_file(os.path.join(security.DATA_DIR, fn))
+
+
+def read_tick_chunks(fn, chunk_rows=CHUNK_ROWS):
+    ## (stamps, prices, sizes) per chunk of the tick file
+    for df in pandas.read_csv(fn, chunksize=chunk_rows):
+        source = df['Timestamp'] if 'Timestamp' in df.columns else _timestamp_source(df)
+        sizes = df['Size'] if 'Size' in df.columns else df['Volume']
+        yield parse_timestamps(source), df['Price'].to_numpy(dtype=numpy.float64), sizes.to_numpy(dtype=numpy.float64)
+
+
+def stream_bars(fn, bar_type=BarType.TIME, size=60, chunk_rows=CHUNK_ROWS):
+    ## generator of bar column blocks, one per tick chunk - for consumers
+    ## that want to process bars without holding them all
+    agg = TickAggregator(bar_type, size)
+    for stamps, prices, sizes in read_tick_chunks(fn, chunk_rows):
+        bars = agg.update(stamps, prices, sizes)
+        if len(bars['Date']) > 0:
+            yield bars
+    bars = agg.flush()
+    if len(bars['Date']) > 0:
+        yield bars
+
+
+def build_tick_bars(fn, bar_type=BarType.TIME, size=60, chunk_rows=CHUNK_ROWS):
+    blocks = list(stream_bars(fn, bar_type, size, chunk_rows))
+    if not blocks:
+        return _empty_bars()
+    return { col: numpy.concatenate([ b[col] for b in blocks ]) for col in blocks[0].keys() }
+
+
+def get_tick_bar_data(symbol, spec, start_dt=None, end_dt=None, warmup_bars=0, reload=False, session=None):
+    ## registry + optional binary cache front end for build_tick_bars
+    bar_type = BarType(spec.get('bar_type', BarType.TIME))
+    size = _bar_size(bar_type, spec.get('size', 60))
+    fn = tick_file(symbol, spec)
+
+    key = (symbol, 'ticks', bar_type.value, size, str(start_dt), str(end_dt), warmup_bars, str(session))
+    data = security._REGISTRY.get(key)
+    if data is None or reload:
+        build = lambda: build_tick_bars(fn, bar_type, size)
+        if spec.get('cache', True):
+            columns = load_built_columns(f'{symbol}/bars.{bar_type.value}.{size}', [fn], build)
+        else:
+            columns = build()
+        columns = session_columns(columns, session)
+        if start_dt is not None or end_dt is not None:
+            columns = window_columns(columns, start_dt, end_dt, warmup_bars)
+        data = BarData(columns)
+        security._REGISTRY[key] = data
+    return data
@@ -0,0 +1,139 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import pandas
+from prettytable import PrettyTable
+import security
+from security import Security, load_columns, symbol_file, is_compressed
+
+
+class Universe():
+    def __init__(self):
+
+        """
+        result of load_universe()
+
+        self.securities = { symbol: Security } for every symbol that loaded
+        self.load_times = { symbol: seconds } per symbol, failures included
+        self.failures = { symbol: error string }
+        """
+
+        self.securities = dict()
+        self.load_times = dict()
+        self.failures = dict()
+
+    def __getitem__(self, symbol):
+        return self.securities[symbol]
+
+    def __contains__(self, symbol):
+        return symbol in self.securities
+
+    def __iter__(self):
+        return iter(self.securities.values())
+
+    def __len__(self):
+        return len(self.securities)
+
+    def symbols(self):
+        return list(self.securities.keys())
+
+    def report(self):
+        rows = []
+        for symbol, secs in self.load_times.items():
+            error = self.failures.get(symbol, '')
+            status = 'FAILED' if error else 'OK'
+            rows.append(dict(Symbol=symbol, Status=status, LoadTime=secs, Error=error))
+        return pandas.DataFrame(rows)
+
+    def dump_report(self):
+        report_df = self.report()
+        table = PrettyTable(report_df.columns.tolist())
+        table.align = "l"
+        table.float_format['LoadTime'] = ".4"
+        for i, row in report_df.iterrows():
+            table.add_row(row.tolist())
+        print(table)
+
+
+def _timed(func):
+    ## (result, seconds, error string) - the time spent is kept when func raises
+    t = time.perf_counter()
+    try:
+        return func(), time.perf_counter() - t, ''
+    except Exception as e:
+        return None, time.perf_counter() - t, f'{type(e).__name__}: {e}'
+
+
+def _warm_cache(symbol):
+    ## process pool worker: decompress + parse the csv and write the binary
+    ## cache. only the elapsed time and the error cross the process boundary
+    _, secs, error = _timed(lambda: load_columns(symbol_file(symbol), symbol))
+    return secs, error
+
+
+def load_universe(symbol_defs, max_workers=8, use_processes=None, start_dt=None, end_dt=None, warmup_bars=0):
+
+    """
+    load a list of symbol definitions (the same dicts the *_run.py scripts
+    build) concurrently. a failing symbol is recorded in Universe.failures
+    and never aborts the batch.
+
+    use_processes=True parses csvs in a process pool that fills the binary
+    cache, then attaches to the cache from this process. worth it for
+    large, cold universes where parsing is cpu bound. the default (None)
+    uses the pool whenever the cache is on and a symbol's source is
+    compressed - decompression is paid once per file version, every later
+    load maps the cache. without a cache the pool's work would be thrown
+    away and every file parsed twice.
+    """
+
+    universe = Universe()
+
+    ## one load per symbol - duplicates share the registry anyway
+    defs = dict()
+    for symbol_def in symbol_defs:
+        defs.setdefault(symbol_def.get('symbol'), symbol_def)
+
+    def _load(symbol_def):
+        return _timed(lambda: Security(symbol_def, start_dt=start_dt, end_dt=end_dt, warmup_bars=warmup_bars))
+
+    if use_processes is None:
+        use_processes = bool(security.CACHE_DIR) and any( is_compressed(symbol_file(symbol)) for symbol in defs )
+
+    warm_times = dict()
+    if use_processes:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            ## continuous futures and tick bars build their own caches on load
+            futures = { symbol: pool.submit(_warm_cache, symbol_def.get('underlying') or symbol) for symbol, symbol_def in defs.items()
+                                                if not (symbol_def.get('continuous') or symbol_def.get('ticks')) }
+            for symbol, future in futures.items():
+                try:
+                    secs, error = future.result()
+                except Exception as e:
+                    ## the pool itself failed - no time came back
+                    secs, error = 0.0, f'{type(e).__name__}: {e}'
+                warm_times[symbol] = secs
+                if error:
+                    universe.load_times[symbol] = secs
+                    universe.failures[symbol] = error
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = { symbol: pool.submit(_load, symbol_def) for symbol, symbol_def in defs.items()
+                                                            if symbol not in universe.failures }
+        for symbol, future in futures.items():
+            sec, secs, error = future.result()
+            universe.load_times[symbol] = secs + warm_times.get(symbol, 0.0)
+            if error:
+                universe.failures[symbol] = error
+            else:
+                universe.securities[symbol] = sec
+
+    return universe
+
+
+if __name__ == '__main__':
+    etf_defs = [ dict(symbol=symbol, sec_type="ETF", tick_size=0.01, tick_value=0.01)
+                    for symbol in 'SPY QQQ IWM DIA TLT GLD'.split() ]
+
+    universe = load_universe(etf_defs)
+    universe.dump_report()
+